@@ -3,8 +3,6 @@
 """
 import argparse
 import logging
-from utils.registry import Registry
-from utils.worker import Worker
 from utils.logger import get_logger
 
 logger = get_logger('Harvest', logging.DEBUG)
@@ -17,6 +15,8 @@ def reg(ip, log_level):
     :param log_level: string, log level to filter logs
     :return:
     """
+    # roles import their own modules, so a role does not wait for the others' dependencies
+    from utils.registry import Registry
     registry = Registry(ip, log_level)
     registry.run()
 
@@ -27,10 +27,28 @@ def worker(log_level):
     :param log_level: string, log level to filter logs
     :return:
     """
+    from utils.worker import Worker
     worker = Worker(log_level)
     worker.run()
 
 
+def compile_areas(log_level):
+    """
+    compile the areas and the geocoding grid to the artifacts that workers map,
+    and bundle the nltk resources so workers never download them
+    :param log_level: string, log level to filter logs
+    :return:
+    """
+    from utils.config import Config
+    from utils.geocoder import create_geocoder
+    from utils.geometry import AreaStore
+    from utils.resources import fetch_nltk_resources
+    config = Config(log_level)
+    store = AreaStore.compiled(config.aus_sa2_2016_lv12_path, config.aus_sa2_2016_lv12_artifact_path, logger)
+    create_geocoder(config, store, logger)
+    fetch_nltk_resources(config.nltk_data_path, logger)
+
+
 def parse_log_level(log_level):
     """
     parse log level to logging level names
@@ -55,7 +73,7 @@ def parse():
     Parse the input args and run as the specific role
     """
     parser = argparse.ArgumentParser()
-    parser.add_argument("-r", "--role", help="specify the role in [reg,]")
+    parser.add_argument("-r", "--role", help="specify the role in [reg, worker, compile]")
     parser.add_argument("-i", "--ip", nargs='?', help="IP address that Registry used to communicate with workers.")
     parser.add_argument("-l", "--log", nargs='?', default='debug',
                         help="output log level  [critical, fatal, error, warning, warn ,info, debug, notset]")
@@ -68,6 +86,9 @@ def parse():
         elif args.role == 'worker':
             # Start worker
             worker(args.log)
+        elif args.role == 'compile':
+            # Compile areas
+            compile_areas(args.log)
         else:
             parser.print_help()
     else:
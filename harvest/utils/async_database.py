@@ -0,0 +1,211 @@
+"""
+@author Team 42, Chengdu, China, Qifan Deng, 1077479
+"""
+import asyncio
+import json
+import threading
+import aiohttp
+
+from urllib.parse import quote
+
+# query parameters whose values are JSON, the others are sent as they are
+JSON_PARAMS = {'key', 'keys', 'startkey', 'start_key', 'endkey', 'end_key', 'include_docs', 'descending', 'limit',
+               'skip', 'reduce', 'group', 'group_level', 'inclusive_end', 'update_seq', 'conflicts'}
+
+
+class AsyncCouchDB:
+    def __init__(self, couch, max_connections=10, timeout=60):
+        """
+        An asyncio CouchDB client, the requests of all threads run on one event loop thread
+        over a pool of keep-alive connections, at most max_connections of them at the same time.
+        Coroutines are scheduled by submit, or run by run from other threads.
+        :param couch: CouchConfig, CouchDB config
+        :param max_connections: int, max number of connections, requests beyond it wait for a connection
+        :param timeout: float, max seconds of a request
+        """
+        self.url = couch.url
+        self.auth = aiohttp.BasicAuth(couch.username, couch.password)
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.session = None
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.run(self.open())
+
+    async def open(self):
+        """
+        create the session on the event loop
+        """
+        self.session = aiohttp.ClientSession(auth=self.auth,
+                                             connector=aiohttp.TCPConnector(limit=self.max_connections),
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    def close(self):
+        """
+        close the connections and stop the event loop
+        """
+        self.run(self.session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def submit(self, coro):
+        """
+        schedule a coroutine on the event loop
+        :param coro: coroutine
+        :return: concurrent.futures.Future of its result
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        """
+        run a coroutine on the event loop and wait for it, must not be called on the event loop thread
+        :param coro: coroutine
+        :return: its result
+        """
+        return self.submit(coro).result()
+
+    @staticmethod
+    def path(db_name, *parts):
+        """
+        :param db_name: database name
+        :param parts: str, path parts, doc ids are quoted
+        :return: str, url path
+        """
+        return '/' + '/'.join([quote(db_name, safe='')] + [quote(part, safe='') for part in parts])
+
+    @staticmethod
+    def params(params):
+        """
+        :param params: dict, query parameters
+        :return: dict, query parameters encoded as CouchDB expects
+        """
+        return {key: json.dumps(value) if key in JSON_PARAMS else str(value)
+                for key, value in params.items() if value is not None}
+
+    async def request(self, method, path, params=None, body=None, allow_not_found=False):
+        """
+        send a request
+        :param method: str, http method
+        :param path: str, url path
+        :param params: dict, query parameters
+        :param body: JSON body
+        :param allow_not_found: bool, return None rather than raise on 404
+        :return: JSON response, status code for HEAD
+        """
+        async with self.session.request(method, self.url + path, params=self.params(params or {}),
+                                        json=body) as response:
+            if allow_not_found and response.status == 404:
+                return None
+            response.raise_for_status()
+            if method == 'HEAD':
+                return response.status
+            return await response.json(content_type=None)
+
+    async def exists(self, db_name, doc_id):
+        """
+        :param db_name: database name
+        :param doc_id: str, doc id
+        :return: bool, whether the doc exists
+        """
+        return await self.request('HEAD', self.path(db_name, doc_id), allow_not_found=True) is not None
+
+    async def get(self, db_name, doc_id):
+        """
+        :param db_name: database name
+        :param doc_id: str, doc id
+        :return: dict, the doc, None if it does not exist
+        """
+        return await self.request('GET', self.path(db_name, doc_id), allow_not_found=True)
+
+    async def all_docs(self, db_name, keys=None, **params):
+        """
+        query _all_docs, by POST if keys are given
+        :param db_name: database name
+        :param keys: list, doc ids
+        :param params: query parameters, e.g. include_docs, startkey, limit
+        :return: dict, the result with rows
+        """
+        if keys is not None:
+            return await self.request('POST', self.path(db_name, '_all_docs'), params, {'keys': list(keys)})
+        return await self.request('GET', self.path(db_name, '_all_docs'), params)
+
+    async def bulk_docs(self, db_name, docs):
+        """
+        create or update docs by one request
+        :param db_name: database name
+        :param docs: list, docs
+        :return: list, result of each doc, conflicted docs have the error 'conflict'
+        """
+        return await self.request('POST', self.path(db_name, '_bulk_docs'), body={'docs': docs})
+
+    async def view(self, db_name, ddoc, view, keys=None, **params):
+        """
+        query a view, by POST if keys are given
+        :param db_name: database name
+        :param ddoc: str, design doc name without _design/
+        :param view: str, view name
+        :param keys: list, keys
+        :param params: query parameters, e.g. reduce, group_level, limit
+        :return: dict, the result with rows
+        """
+        path = self.path(db_name, '_design') + '/' + '/'.join(quote(part, safe='') for part in [ddoc, '_view', view])
+        if keys is not None:
+            return await self.request('POST', path, params, {'keys': list(keys)})
+        return await self.request('GET', path, params)
+
+    async def changes(self, db_name, since=None, limit=None, **params):
+        """
+        read the changes feed
+        :param db_name: database name
+        :param since: str, sequence to start after, None from the beginning
+        :param limit: int, max number of changes
+        :param params: query parameters, e.g. include_docs
+        :return: dict, the result with results and last_seq
+        """
+        return await self.request('GET', self.path(db_name, '_changes'), dict(params, since=since, limit=limit))
+
+    async def missing_ids(self, db_name, ids):
+        """
+        find the docs that do not exist by one _all_docs request
+        :param db_name: database name
+        :param ids: list, doc ids
+        :return: set, ids of the docs that are missing or deleted
+        """
+        if not ids:
+            return set()
+        rows = (await self.all_docs(db_name, keys=ids))['rows']
+        return {row['key'] for row in rows if 'error' in row or row['value'].get('deleted')}
+
+    async def update_docs(self, db_name, updates):
+        """
+        set fields of existing docs by one bulk read and one bulk write
+        :param db_name: database name
+        :param updates: dict, doc id -> dict of field -> value
+        :return: (set, int) ids of the docs conflicted with other writers, number of docs updated,
+        missing docs are not created
+        """
+        rows = (await self.all_docs(db_name, keys=updates, include_docs=True))['rows']
+        docs = []
+        for row in rows:
+            if row.get('doc') is not None:
+                row['doc'].update(updates[row['key']])
+                docs.append(row['doc'])
+        if not docs:
+            return set(), 0
+        results = await self.bulk_docs(db_name, docs)
+        conflicts = {result['id'] for result in results if result.get('error') == 'conflict'}
+        return conflicts, len(docs) - len(conflicts)
+
+    async def update_fields(self, db_name, doc_id, fields, max_tries=5):
+        """
+        set fields of an existing doc, read again if it is conflicted
+        :param db_name: database name
+        :param doc_id: str, doc id
+        :param fields: dict, field -> value
+        :param max_tries: int, max number of tries
+        :return: bool, whether it is updated
+        """
+        for _ in range(max_tries):
+            conflicts, updated = await self.update_docs(db_name, {doc_id: fields})
+            if not conflicts:
+                return updated > 0
+        return False
@@ -0,0 +1,158 @@
+"""
+@author Team 42, Chengdu, China, Qifan Deng, 1077479
+"""
+import hashlib
+import math
+import os
+import struct
+import threading
+
+# magic, number of bits, number of hashes, capacity, number of added keys of each generation
+HEADER = struct.Struct('<8sQIQQQ')
+MAGIC = b'SEENIDS1'
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        """
+        A Bloom filter, a key that is added is always found, a key that is not added is found
+        with probability error_rate until capacity keys are added
+        https://en.wikipedia.org/wiki/Bloom_filter
+        :param capacity: int, number of keys it is sized for
+        :param error_rate: float, false positive rate at the capacity
+        """
+        self.capacity = capacity
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def indexes(self, key):
+        """
+        :param key: str, key
+        :return: generator of the bit indexes of a key, by double hashing of two 64 bits hashes
+        """
+        h1, h2 = struct.unpack('<QQ', hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest())
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key):
+        """
+        :param key: str, key
+        """
+        for idx in self.indexes(key):
+            self.bits[idx >> 3] |= 1 << (idx & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[idx >> 3] & (1 << (idx & 7)) for idx in self.indexes(key))
+
+
+class SeenIds:
+    def __init__(self, capacity, error_rate):
+        """
+        A set of doc ids that are known to be in the database, backed by two generations of Bloom filters.
+        Once the current generation is full it becomes the previous one and a new one is started,
+        so the false positive rate stays below about twice the error rate however many ids are added.
+        :param capacity: int, number of ids of a generation
+        :param error_rate: float, false positive rate of a generation
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous = None
+
+    def add(self, doc_ids):
+        """
+        :param doc_ids: iterable, doc ids known to be in the database
+        """
+        with self.lock:
+            for doc_id in doc_ids:
+                if self.current.count >= self.capacity:
+                    self.previous = self.current
+                    self.current = BloomFilter(self.capacity, self.error_rate)
+                self.current.add(doc_id)
+
+    def __contains__(self, doc_id):
+        current, previous = self.current, self.previous
+        return doc_id in current or (previous is not None and doc_id in previous)
+
+    def unseen(self, doc_ids):
+        """
+        :param doc_ids: iterable, doc ids
+        :return: set, ids that are not known to be in the database
+        """
+        return {doc_id for doc_id in doc_ids if doc_id not in self}
+
+    def save(self, path):
+        """
+        write the filters to a file, replaced at once so a crash never leaves a partial file
+        :param path: str, file path
+        """
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with self.lock:
+            filters = [self.current] if self.previous is None else [self.current, self.previous]
+            with open(tmp_path, 'wb') as f:
+                for bloom in filters:
+                    f.write(HEADER.pack(MAGIC, bloom.num_bits, bloom.num_hashes, bloom.capacity, bloom.count,
+                                        len(bloom.bits)))
+                    f.write(bloom.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, capacity, error_rate):
+        """
+        read the filters written by save, the filters are new if the file does not exist
+        or is sized for another capacity or error rate
+        :param path: str, file path
+        :param capacity: int, number of ids of a generation
+        :param error_rate: float, false positive rate of a generation
+        :return: SeenIds
+        """
+        seen = cls(capacity, error_rate)
+        if not os.path.exists(path):
+            return seen
+        filters = []
+        with open(path, 'rb') as f:
+            while True:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                magic, num_bits, num_hashes, bloom_capacity, count, size = HEADER.unpack(header)
+                if magic != MAGIC or num_bits != seen.current.num_bits or num_hashes != seen.current.num_hashes \
+                        or bloom_capacity != capacity:
+                    return seen
+                bloom = BloomFilter(capacity, error_rate)
+                bloom.bits = bytearray(f.read(size))
+                bloom.count = count
+                if len(bloom.bits) != size:
+                    return seen
+                filters.append(bloom)
+        if filters:
+            seen.current = filters[0]
+            seen.previous = filters[1] if len(filters) > 1 else None
+        return seen
+
+    def stats(self):
+        """
+        :return: dict, ids of the current and the previous generations
+        """
+        return {'current': self.current.count, 'previous': self.previous.count if self.previous else 0}
+
+
+if __name__ == '__main__':
+    # testing code, measure the false positive rate
+    import random
+
+    seen = SeenIds(100000, 0.001)
+    added = ["australia:{}".format(random.getrandbits(62)) for _ in range(250000)]
+    seen.add(added)
+    assert all(doc_id in seen for doc_id in added[-100000:])
+    others = ["australia:{}".format(random.getrandbits(62)) for _ in range(100000)]
+    print("False positive rate: {:.5f}".format(sum(doc_id in seen for doc_id in others) / len(others)))
+    seen.save('/tmp/seen_ids.bloom')
+    loaded = SeenIds.load('/tmp/seen_ids.bloom', 100000, 0.001)
+    assert all(doc_id in loaded for doc_id in added[-100000:]) and loaded.stats() == seen.stats()
+    print(loaded.stats())
@@ -0,0 +1,296 @@
+"""
+@author Team 42, Chengdu, China, Qifan Deng, 1077479
+"""
+import asyncio
+import threading
+import traceback
+
+from collections import deque
+from time import time
+
+
+class BulkWriter:
+    def __init__(self, couch, db_name, logger, min_size, max_size, max_latency, target_latency, max_in_flight,
+                 max_pending, max_tries, retry_wait, on_fail=None, on_written=None):
+        """
+        Write docs to a database by _bulk_docs requests on the event loop of an async client.
+        A bulk is written once it reaches the bulk size or its oldest doc has waited max_latency seconds.
+        The bulk size grows while requests take less than target_latency and halves when they are slower,
+        so the throughput follows the load of the cluster.
+        When max_pending docs are waiting, add blocks, so the recorders stop taking from their queues
+        and the queued items wait on disk.
+        Each added doc has a sequence number, the watermark tells the recorders which of them are written.
+        :param couch: AsyncCouchDB, the client
+        :param db_name: database name
+        :param logger: logger to report the failed requests
+        :param min_size: int, min number of docs of a bulk, also the initial bulk size
+        :param max_size: int, max number of docs of a bulk
+        :param max_latency: float, max seconds a doc waits before its bulk is written
+        :param target_latency: float, seconds a bulk request is expected to take
+        :param max_in_flight: int, max number of bulk requests at the same time
+        :param max_pending: int, max number of docs waiting to be written
+        :param max_tries: int, max number of requests to write a bulk
+        :param retry_wait: float, seconds to wait before retrying a failed request
+        :param on_fail: function, called with a message if a bulk is not written after max_tries
+        :param on_written: function, called with the docs of a bulk once it is written
+        """
+        self.couch = couch
+        self.db_name = db_name
+        self.logger = logger
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_latency = max_latency
+        self.target_latency = target_latency
+        self.max_in_flight = max_in_flight
+        self.max_pending = max_pending
+        self.max_tries = max_tries
+        self.retry_wait = retry_wait
+        self.on_fail = on_fail
+        self.on_written = on_written
+
+        self.cond = threading.Condition()
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        # (doc, time it is added, sequence number), ids of the docs waiting or being written
+        self.pending = deque()
+        self.ids = set()
+        # number of docs added, sequence numbers of the first docs of the bulks being written
+        self.added = 0
+        self.writing = set()
+        self.size = min_size
+        self.latency = 0.0
+        self.written = 0
+        self.requests = 0
+        self.failed = 0
+
+    def start(self):
+        """
+        start the dispatcher thread
+        """
+        threading.Thread(target=self.dispatcher, daemon=True).start()
+
+    def add(self, docs):
+        """
+        queue docs to be written, blocks while too many docs are waiting
+        :param docs: list, docs with _id
+        :return: int, number of docs queued, docs already waiting or being written are skipped
+        """
+        with self.cond:
+            while len(self.pending) >= self.max_pending:
+                self.cond.wait()
+            now = time()
+            count = 0
+            for doc in docs:
+                if doc['_id'] in self.ids:
+                    continue
+                self.pending.append((doc, now, self.added))
+                self.ids.add(doc['_id'])
+                self.added += 1
+                count += 1
+            if count:
+                self.cond.notify_all()
+            return count
+
+    def take(self):
+        """
+        wait until a bulk is full or its oldest doc reaches the max latency
+        :return: (list, int) docs of a bulk, sequence number of its first doc
+        """
+        with self.cond:
+            while True:
+                if not self.pending:
+                    self.cond.wait()
+                    continue
+                wait = self.pending[0][1] + self.max_latency - time()
+                if len(self.pending) >= self.size or wait <= 0:
+                    first = self.pending[0][2]
+                    self.writing.add(first)
+                    bulk = [self.pending.popleft()[0] for _ in range(min(self.size, len(self.pending)))]
+                    # wake up the blocked add
+                    self.cond.notify_all()
+                    return bulk, first
+                self.cond.wait(wait)
+
+    def adapt(self, latency):
+        """
+        adjust the bulk size by the latency of a request, additive increase and multiplicative decrease
+        :param latency: float, seconds a request took, None if it failed
+        """
+        if latency is not None and latency <= self.target_latency:
+            self.size = min(self.max_size, self.size + self.min_size)
+        else:
+            self.size = max(self.min_size, self.size // 2)
+        if latency is not None:
+            self.latency = latency if not self.requests else 0.8 * self.latency + 0.2 * latency
+
+    async def write(self, bulk, first):
+        """
+        write a bulk, failed requests are retried
+        :param bulk: list, docs
+        :param first: int, sequence number of its first doc
+        :return: bool, whether it is written
+        """
+        for _ in range(self.max_tries):
+            start = time()
+            try:
+                await self.couch.bulk_docs(self.db_name, bulk)
+            except Exception:
+                # prevent proxy err (mainly for Qifan's proxy against GFW)
+                self.logger.warning("[!] Bulk of {} docs err: {}".format(len(bulk), traceback.format_exc()))
+                with self.cond:
+                    self.adapt(None)
+                await asyncio.sleep(self.retry_wait)
+                continue
+            with self.cond:
+                self.adapt(time() - start)
+                self.requests += 1
+                self.written += len(bulk)
+                self.ids.difference_update(doc['_id'] for doc in bulk)
+                self.writing.discard(first)
+            if self.on_written is not None:
+                self.on_written(bulk)
+            return True
+
+        # the bulk stays in writing, so the watermark does not pass it
+        with self.cond:
+            self.failed += len(bulk)
+            self.ids.difference_update(doc['_id'] for doc in bulk)
+        if self.on_fail is not None:
+            self.on_fail("[!] Bulk of {} docs err {} times, exit".format(len(bulk), self.max_tries))
+        return False
+
+    def dispatcher(self):
+        """
+        the dispatcher thread, schedules the bulks on the event loop, at most max_in_flight of them at the same time
+        """
+        while True:
+            bulk, first = self.take()
+            self.in_flight.acquire()
+            self.couch.submit(self.write(bulk, first)).add_done_callback(lambda _: self.in_flight.release())
+
+    def watermark(self):
+        """
+        :return: int, the docs added before this sequence number are all written,
+        compared with the number of docs added (the added attribute) after an add
+        """
+        with self.cond:
+            marks = list(self.writing)
+            if self.pending:
+                marks.append(self.pending[0][2])
+            return min(marks) if marks else self.added
+
+    def stats(self):
+        """
+        :return: dict, current bulk size, waiting docs, written docs, requests, failed docs and average latency
+        """
+        with self.cond:
+            return {'size': self.size, 'pending': len(self.pending), 'written': self.written,
+                    'requests': self.requests, 'failed': self.failed, 'latency': round(self.latency, 3)}
+
+
+class BulkUpdater:
+    def __init__(self, couch, db_name, logger, max_size, max_latency, max_tries, retry_wait):
+        """
+        Set fields of existing docs by batches, the docs of a batch are read by one _all_docs request
+        and written by one _bulk_docs request, rather than a read-modify-write request per field.
+        Updates of the same doc are merged, the later value of a field wins.
+        :param couch: AsyncCouchDB, the client
+        :param db_name: database name
+        :param logger: logger to report the failed requests
+        :param max_size: int, max number of docs of a batch
+        :param max_latency: float, max seconds an update waits before its batch is applied
+        :param max_tries: int, max number of tries to apply a batch, conflicted docs are read again
+        :param retry_wait: float, seconds to wait before retrying a failed request
+        """
+        self.couch = couch
+        self.db_name = db_name
+        self.logger = logger
+        self.max_size = max_size
+        self.max_latency = max_latency
+        self.max_tries = max_tries
+        self.retry_wait = retry_wait
+
+        self.cond = threading.Condition()
+        # doc id -> fields to set, in the order of the first update, time of the oldest update
+        self.updates = {}
+        self.oldest = None
+        self.updated = 0
+        self.batches = 0
+        self.failed = 0
+
+    def start(self):
+        """
+        start the updater thread
+        """
+        threading.Thread(target=self.updater, daemon=True).start()
+
+    def update(self, doc_id, fields):
+        """
+        queue fields to be set on a doc
+        :param doc_id: str, doc id
+        :param fields: dict, field -> value
+        """
+        with self.cond:
+            if not self.updates:
+                self.oldest = time()
+            self.updates.setdefault(doc_id, {}).update(fields)
+            self.cond.notify_all()
+
+    def take(self):
+        """
+        wait until a batch is full or its oldest update reaches the max latency
+        :return: dict, doc id -> fields of a batch
+        """
+        with self.cond:
+            while True:
+                if not self.updates:
+                    self.cond.wait()
+                    continue
+                wait = self.oldest + self.max_latency - time()
+                if len(self.updates) >= self.max_size or wait <= 0:
+                    doc_ids = list(self.updates)[:self.max_size]
+                    batch = {doc_id: self.updates.pop(doc_id) for doc_id in doc_ids}
+                    # the rest keep the time of the oldest update, so they are not applied later than it
+                    if not self.updates:
+                        self.oldest = None
+                    return batch
+                self.cond.wait(wait)
+
+    async def apply(self, batch):
+        """
+        apply a batch of updates, docs conflicted with other writers are read and written again
+        :param batch: dict, doc id -> fields
+        :return: bool, whether all updates are applied
+        """
+        for _ in range(self.max_tries):
+            try:
+                conflicts, updated = await self.couch.update_docs(self.db_name, batch)
+            except Exception:
+                self.logger.warning("[!] Update of {} docs err: {}".format(len(batch), traceback.format_exc()))
+                await asyncio.sleep(self.retry_wait)
+                continue
+            with self.cond:
+                self.batches += 1
+                self.updated += updated
+            if not conflicts:
+                return True
+            batch = {doc_id: batch[doc_id] for doc_id in conflicts}
+
+        with self.cond:
+            self.failed += len(batch)
+        self.logger.warning("[!] Update of {} docs failed {} times".format(len(batch), self.max_tries))
+        return False
+
+    def updater(self):
+        """
+        the updater thread, batches are applied one by one, so updates of a doc are applied in order
+        """
+        while True:
+            self.couch.run(self.apply(self.take()))
+
+    def stats(self):
+        """
+        :return: dict, waiting updates, updated docs, applied batches and failed updates
+        """
+        with self.cond:
+            return {'pending': len(self.updates), 'updated': self.updated, 'batches': self.batches,
+                    'failed': self.failed}
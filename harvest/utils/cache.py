@@ -0,0 +1,69 @@
+"""
+@author Team 42, Chengdu, China, Qifan Deng, 1077479
+"""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, capacity):
+        """
+        A bounded least recently used cache with hit, miss and eviction counters
+        :param capacity: int, max number of items
+        """
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        get an item and mark it as recently used
+        :param key: item key
+        :param default: returned if the key is not cached
+        :return: the cached value or default
+        """
+        self.lock.acquire()
+        if key in self.items:
+            self.items.move_to_end(key)
+            value = self.items[key]
+            self.hits += 1
+        else:
+            value = default
+            self.misses += 1
+        self.lock.release()
+        return value
+
+    def put(self, key, value):
+        """
+        cache an item, the least recently used item is evicted if the cache is full
+        :param key: item key
+        :param value: item value
+        """
+        self.lock.acquire()
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+            self.evictions += 1
+        self.lock.release()
+
+    def __len__(self):
+        return len(self.items)
+
+    def stats(self):
+        """
+        :return: dict, cache size and counters
+        """
+        self.lock.acquire()
+        lookups = self.hits + self.misses
+        stats = {'size': len(self.items),
+                 'capacity': self.capacity,
+                 'hits': self.hits,
+                 'misses': self.misses,
+                 'evictions': self.evictions,
+                 'hit_rate': round(self.hits / lookups, 4) if lookups else 0}
+        self.lock.release()
+        return stats
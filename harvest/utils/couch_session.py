@@ -0,0 +1,106 @@
+"""
+@author Team 42, Chengdu, China, Qifan Deng, 1077479
+"""
+import threading
+from time import time
+from cloudant.client import Cloudant
+from cloudant.database import CloudantDatabase
+from requests.adapters import HTTPAdapter
+
+
+class PooledAdapter(HTTPAdapter):
+    def __init__(self, pool_size):
+        """
+        An HTTP adapter that keeps up to pool_size keep-alive connections shared by all threads,
+        a request beyond the pool size waits for a free connection rather than opening one to be discarded
+        :param pool_size: int, max number of connections
+        """
+        super().__init__(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.pool_size = pool_size
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.requests = 0
+
+    def send(self, request, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            self.requests += 1
+        try:
+            return super().send(request, **kwargs)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def stats(self):
+        """
+        :return: dict, pool size, requests in flight including those waiting for a connection and their peak,
+        utilization, requests and opened connections
+        """
+        pools = self.poolmanager.pools
+        connections = sum(pools[key].num_connections for key in pools.keys())
+        with self.lock:
+            return {'pool_size': self.pool_size, 'in_flight': self.in_flight, 'peak': self.peak,
+                    'utilization': round(self.in_flight / self.pool_size, 2), 'requests': self.requests,
+                    'connections': connections}
+
+
+class CachedDatabase(CloudantDatabase):
+    def __init__(self, client, database_name, **kwargs):
+        """
+        A database whose local doc cache is bounded, a doc is fetched again once it is cached for longer than
+        the ttl of the client, and the earliest fetched docs are dropped beyond the capacity of the client
+        :param client: PooledCloudant
+        :param database_name: database name
+        """
+        super().__init__(client, database_name, **kwargs)
+        self.cache_lock = threading.Lock()
+        # doc id -> time it is fetched
+        self.cached_at = {}
+
+    def __getitem__(self, key):
+        cached_at = self.cached_at.get(key)
+        if cached_at is not None and time() - cached_at <= self.client.doc_cache_ttl \
+                and dict.__contains__(self, key):
+            doc = dict.__getitem__(self, key)
+        else:
+            # fetched again, and moved to the end of the cache
+            dict.pop(self, key, None)
+            doc = super().__getitem__(key)
+            self.cached_at[key] = time()
+        with self.cache_lock:
+            while dict.__len__(self) > self.client.doc_cache_capacity:
+                earliest = next(iter(dict.keys(self)))
+                dict.pop(self, earliest, None)
+                self.cached_at.pop(earliest, None)
+        return doc
+
+
+class PooledCloudant(Cloudant):
+    _DATABASE_CLASS = CachedDatabase
+
+    def __init__(self, user, auth_token, url, pool_size=10, timeout=60, doc_cache_capacity=1000, doc_cache_ttl=5,
+                 **kwargs):
+        """
+        A Cloudant client shared by all threads over a pool of keep-alive connections,
+        the session is renewed when it expires rather than reconnected by the callers
+        :param user: str, username
+        :param auth_token: str, password
+        :param url: str, CouchDB url
+        :param pool_size: int, max number of connections
+        :param timeout: float, max seconds of a request
+        :param doc_cache_capacity: int, max number of cached docs of each database
+        :param doc_cache_ttl: float, seconds a cached doc is used before it is fetched again
+        """
+        self.pooled_adapter = PooledAdapter(pool_size)
+        self.doc_cache_capacity = doc_cache_capacity
+        self.doc_cache_ttl = doc_cache_ttl
+        super().__init__(user, auth_token, url=url, adapter=self.pooled_adapter, timeout=timeout, auto_renew=True,
+                         **kwargs)
+
+    def stats(self):
+        """
+        :return: dict, connection pool stats
+        """
+        return self.pooled_adapter.stats()
@@ -14,6 +14,7 @@ from time import sleep, time
 
 from utils.config import Config
 from utils.logger import get_logger
+from utils.rate_limiter import RateLimiter
 
 
 class Crawler:
@@ -26,11 +27,9 @@ class Crawler:
         # create attributes
         self.logger = get_logger('Crawler', log_level)
         self.config = Config(log_level)
-        self.lock_friends = Lock()
-        self.lock_user_timeline = Lock()
         self.lock_rate_limits = Lock()
-        self.lock_followers = Lock()
-        self.lock_lookup_users = Lock()
+        # permits of each endpoint, synced with the rate limit status
+        self.limiter = RateLimiter()
         self.id = None
         self.api_keys = {}
         for idx, credential in enumerate(self.config.twitter):
@@ -49,10 +48,6 @@ class Crawler:
         self.rate_limits = None
         self.rate_limits_updated_at = 0
 
-        self.access_user_timeline = 0
-        self.access_friends = 0
-        self.access_followers = 0
-        self.access_lookup_users = 0
         self.stream_bbox = None
         self.stream_area = None
 
@@ -102,14 +97,17 @@ class Crawler:
 
         # lock rate limit
         self.lock_rate_limits.acquire()
-        # sleep if it was accessed in the previous 5 seconds
-        self.sleep(int(time()) - self.rate_limits_updated_at, 5)
+        if self.rate_limits is not None and int(time()) - self.rate_limits_updated_at < 5:
+            # it was just updated by another thread
+            self.lock_rate_limits.release()
+            return
         # update its accessing time
         self.rate_limits_updated_at = int(time())
         self.lock_rate_limits.release()
         try:
             # get the rate limits from twitter api
-            self.rate_limits = self.api.rate_limit_status()
+            self.rate_limits = self.call('rate_limit_status', self.api.rate_limit_status)
+            self.limiter.sync(self.rate_limits)
             self.logger.debug("[{}] Updated rate limit status.".format(self.id))
         except tweepy.TweepError:
             if self.rate_limits is None:
@@ -129,6 +127,26 @@ class Crawler:
             # retry updating
             self.update_rate_limit_status(err_count + 1)
 
+    def call(self, endpoint, method, **kwargs):
+        """
+        call an api method once a permit of its endpoint is taken
+        :param endpoint: str, endpoint name in utils.rate_limiter.ENDPOINTS
+        :param method: the tweepy api method
+        :param kwargs: args of the method
+        :return: result of the method
+        :raises tweepy.RateLimitError: if no permit is left within rate_limit_max_wait seconds,
+        or twitter responds a rate limit error, then the endpoint waits for its reset time
+        """
+        if not self.limiter.acquire(endpoint, self.config.rate_limit_max_wait):
+            raise tweepy.RateLimitError("[{}] No {} permit in {} seconds".format(self.id, endpoint,
+                                                                                 self.config.rate_limit_max_wait))
+        try:
+            return method(**kwargs)
+        except tweepy.RateLimitError as e:
+            reset = e.response.headers.get('x-rate-limit-reset') if e.response is not None else None
+            self.limiter.exhaust(endpoint, int(reset) if reset else None)
+            raise
+
     def limit_handled(self, cursor, cursor_type):
         """
         limit handled method used to query twitter api in a pagination fashion
@@ -180,18 +198,10 @@ class Crawler:
         :param user_id: user id
         :return: set, follower ids
         """
-        # lock this func in case of occurring rate limit err
-        self.lock_followers.acquire()
-        # sleep to avoid competition
-        self.sleep(int(time()) - self.access_followers, 2)
-        # update the accessing time
-        self.access_followers = int(time())
-        self.lock_followers.release()
-
         # up to a maximum of 5,000 per distinct request
         # https://developer.twitter.com/en/docs/accounts-and-users/follow-search-get-users/api-reference/get-followers-ids
 
-        return set(self.api.followers_ids(count=5000, user_id=user_id))
+        return set(self.call('followers', self.api.followers_ids, count=5000, user_id=user_id))
 
     def lookup_statuses(self, **kwargs):
         """
@@ -200,7 +210,7 @@ class Crawler:
         :return: list, statuses
         """
         try:
-            return self.api.statuses_lookup(**kwargs)
+            return self.call('lookup_statuses', self.api.statuses_lookup, **kwargs)
         except Exception:
             self.logger.warning(traceback.format_exc())
             return []
@@ -211,18 +221,10 @@ class Crawler:
         :param user_id: string or int, user id
         :return: list, friend ids
         """
-        # lock this func in case of occurring rate limit err
-        self.lock_friends.acquire()
-        # sleep to avoid competition
-        self.sleep(int(time()) - self.access_friends, 2)
-        # update the accessing time
-        self.access_friends = int(time())
-        self.lock_friends.release()
-
         # up to a maximum of 5,000 per distinct request
         # https://developer.twitter.com/en/docs/accounts-and-users/follow-search-get-users/api-reference/get-friends-ids
 
-        return set(self.api.friends_ids(count=5000, user_id=user_id))
+        return set(self.call('friends', self.api.friends_ids, count=5000, user_id=user_id))
 
     def get_user_timeline(self, user_id):
         """
@@ -230,17 +232,10 @@ class Crawler:
         :param user_id: string or int, user id
         :return: list, statuses
         """
-        # lock this func in case of occurring rate limit err
-        self.lock_user_timeline.acquire()
-        # sleep to avoid competition
-        self.sleep(int(time()) - self.access_user_timeline, 2)
-        # update the accessing time
-        self.access_user_timeline = int(time())
-        self.lock_user_timeline.release()
         # up to a maximum of 200 per distinct request
         # https://developer.twitter.com/en/docs/tweets/timelines/api-reference/get-statuses-user_timeline
-        return self.api.user_timeline(count=self.config.user_timeline_max_statues, user_id=user_id,
-                                      tweet_mode="extended")
+        return self.call('timeline', self.api.user_timeline, count=self.config.user_timeline_max_statues,
+                         user_id=user_id, tweet_mode="extended")
 
     def lookup_users(self, users_ids):
         """
@@ -248,20 +243,12 @@ class Crawler:
         :param users_ids: user ids in list
         :return: list, user ids
         """
-        # lock this func in case of occurring rate limit err
-        self.lock_lookup_users.acquire()
-        # sleep to avoid competition
-        self.sleep(int(time()) - self.access_lookup_users, 2)
-        # update the accessing time
-        self.access_lookup_users = int(time())
-        self.lock_lookup_users.release()
-
         # Note, this method is not in tweepy official doc but in its source file
         # https://developer.twitter.com/en/docs/accounts-and-users/follow-search-get-users/api-reference/get-users-lookup
         # Requests / 15-min window (user auth)	900
         users = []
         for i in range(0, len(users_ids), 100):
-            users_res = self.api.lookup_users(user_ids=users_ids[i:i + 100])
+            users_res = self.call('lookup_users', self.api.lookup_users, user_ids=users_ids[i:i + 100])
             users += users_res
         return users
 
@@ -275,17 +262,6 @@ class Crawler:
         h.update(bytes(source_str, 'utf-8'))
         return h.hexdigest()
 
-    @staticmethod
-    def sleep(target_time, to_sleep_):
-        """
-        sleep for at least a minimum time
-        :param target_time: target time to sleep
-        :param to_sleep_: minimum time
-        """
-        if target_time <= to_sleep_:
-            target_time = to_sleep_
-            sleep(target_time)
-
 
 class StreamListener(tweepy.StreamListener):
     def __init__(self, worker_id, res_queue, log_level, **kw):
@@ -307,7 +283,8 @@ class StreamListener(tweepy.StreamListener):
         Called when a new status arrives
         :param status: the new status
         """
-        self.res_queue.put(status)
+        # the queue is durable, it keeps the status json
+        self.res_queue.put(status._json)
         self.logger.info("[{}] Got stream status: {}".format(self.id, status._json['id_str']))
 
     def on_error(self, status_code):
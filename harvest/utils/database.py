@@ -3,9 +3,9 @@
 """
 import os
 from time import sleep
-from cloudant.client import Cloudant
 from requests.exceptions import HTTPError
 from utils.config import Config
+from utils.couch_session import PooledCloudant
 from utils.logger import get_logger
 
 
@@ -42,8 +42,10 @@ class CouchDB:
         while count:
             self.logger.debug("[*] Connecting to CouchDB -> {}".format(self.config.couch.url))
             try:
-                self.client = Cloudant(self.config.couch.username, self.config.couch.password,
-                                       url=self.config.couch.url, connect=True)
+                self.client = PooledCloudant(self.config.couch.username, self.config.couch.password,
+                                             self.config.couch.url, self.config.couch_pool_size,
+                                             self.config.couch_timeout, self.config.couch_doc_cache_capacity,
+                                             self.config.couch_doc_cache_ttl, connect=True)
                 self.client.connect()
                 self.client.clear()
                 self.logger.debug("[*] CouchDB connected -> {}".format(self.config.couch.url))
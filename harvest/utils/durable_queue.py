@@ -0,0 +1,395 @@
+"""
+@author Team 42, Chengdu, China, Qifan Deng, 1077479
+"""
+import json
+import os
+import queue
+import struct
+import threading
+import zlib
+
+from collections import deque
+from time import time
+
+# length and crc32 of the payload of a record
+RECORD = struct.Struct('<II')
+SEGMENT_SUFFIX = '.seg'
+CURSOR_NAME = 'cursor'
+
+
+class DurableQueue:
+    def __init__(self, directory, segment_size, fsync_interval, max_bytes, logger):
+        """
+        A disk backed queue of JSON items for one consumer.
+        Items are appended to segment files, put only buffers them in memory and the flusher thread
+        writes and fsyncs the buffer every fsync_interval seconds, so producers do not wait for the disk.
+        Items are read from the flushed segments, and the consumer commits the position it has processed,
+        items after the committed position are read again after a restart.
+        Once max_bytes of items are put but not committed, put blocks until the consumer commits,
+        so a long outage of the consumer cannot fill the volume.
+        :param directory: str, directory of the segment files
+        :param segment_size: int, bytes of a segment, a new segment is started once it is exceeded
+        :param fsync_interval: float, seconds between writing the buffer to disk
+        :param max_bytes: int, max bytes of the items put but not committed
+        :param logger: logger to report corrupted records and full queues
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.logger = logger
+        os.makedirs(directory, exist_ok=True)
+
+        self.cond = threading.Condition()
+        # encoded records put but not written yet
+        self.buffer = []
+        self.put_count = 0
+        self.flushed_count = 0
+        # bytes skipped by corrupted records, times put blocked by a full queue
+        self.skipped = 0
+        self.blocked = 0
+        # whether a full queue is warned, warned again once it is drained to half of max_bytes
+        self.full = False
+
+        segments = self.segments()
+        self.write_segment = segments[-1] if segments else 0
+        self.write_size = self.recover(self.write_segment)
+        self.writer = open(self.segment_path(self.write_segment), 'ab')
+        self.flushed = (self.write_segment, self.write_size)
+
+        # a position is (segment, offset, bytes consumed since the queue is opened)
+        self.committed = self.load_cursor(segments)
+        self.read_segment, self.read_offset, self.consumed = self.committed
+        self.reader = None
+        # bytes put but not committed
+        self.size = sum(self.segment_end(segment) for segment in segments if segment >= self.read_segment) \
+            - self.read_offset
+
+    def segment_path(self, segment):
+        """
+        :param segment: int, segment number
+        :return: str, segment file path
+        """
+        return os.path.join(self.directory, "{:012d}{}".format(segment, SEGMENT_SUFFIX))
+
+    def segments(self):
+        """
+        :return: list, numbers of the segment files in order
+        """
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(SEGMENT_SUFFIX))
+
+    def recover(self, segment):
+        """
+        truncate the record partially written when the worker exited
+        :param segment: int, segment number
+        :return: int, bytes of the valid records of the segment
+        """
+        path = self.segment_path(segment)
+        if not os.path.exists(path):
+            return 0
+        size = 0
+        with open(path, 'rb') as f:
+            while True:
+                header = f.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    break
+                length, crc = RECORD.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                size += RECORD.size + length
+        if size < os.path.getsize(path):
+            self.logger.warning("[!] Truncated {} bytes of a partial or corrupted record at the end of {}".format(
+                os.path.getsize(path) - size, path))
+            with open(path, 'r+b') as f:
+                f.truncate(size)
+        return size
+
+    def load_cursor(self, segments):
+        """
+        :param segments: list, numbers of the segment files
+        :return: (segment, offset, 0) the committed position, the start of the first segment if none is committed
+        """
+        try:
+            with open(os.path.join(self.directory, CURSOR_NAME)) as f:
+                cursor = json.load(f)
+            return cursor['segment'], cursor['offset'], 0
+        except (OSError, ValueError, KeyError):
+            return (segments[0] if segments else 0), 0, 0
+
+    def start(self):
+        """
+        start the flusher thread
+        """
+        threading.Thread(target=self.flusher, daemon=True).start()
+
+    def put(self, item):
+        """
+        put an item, it is durable once the buffer is flushed, blocks while the queue is full
+        :param item: a JSON serializable item
+        """
+        payload = json.dumps(item, separators=(',', ':')).encode('utf-8')
+        record = RECORD.pack(len(payload), zlib.crc32(payload)) + payload
+        with self.cond:
+            if self.size >= self.max_bytes:
+                self.blocked += 1
+                if not self.full:
+                    self.full = True
+                    self.logger.warning("[!] Queue {} holds {} bytes not committed, wait for the consumer".format(
+                        self.directory, self.size))
+                while self.size >= self.max_bytes:
+                    self.cond.wait()
+            self.buffer.append(record)
+            self.put_count += 1
+            self.size += len(record)
+
+    def flush(self):
+        """
+        write the buffered records to the segment and fsync it, start a new segment if it is full
+        """
+        with self.cond:
+            records = self.buffer
+            self.buffer = []
+        if not records:
+            return
+        data = b''.join(records)
+        self.writer.write(data)
+        self.writer.flush()
+        os.fsync(self.writer.fileno())
+        self.write_size += len(data)
+        flushed = (self.write_segment, self.write_size)
+        if self.write_size >= self.segment_size:
+            self.writer.close()
+            self.write_segment += 1
+            self.write_size = 0
+            self.writer = open(self.segment_path(self.write_segment), 'ab')
+        with self.cond:
+            self.flushed = flushed
+            self.flushed_count += len(records)
+            self.cond.notify_all()
+
+    def flusher(self):
+        """
+        the flusher thread
+        """
+        while True:
+            start = time()
+            self.flush()
+            with self.cond:
+                self.cond.wait(max(0.0, self.fsync_interval - (time() - start)))
+
+    def segment_end(self, segment):
+        """
+        :param segment: int, segment number
+        :return: int, bytes of the flushed records of the segment
+        """
+        with self.cond:
+            flushed_segment, flushed_size = self.flushed
+        if segment == flushed_segment:
+            return flushed_size
+        path = self.segment_path(segment)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def read(self):
+        """
+        read the record at the read position, a corrupted record and the rest of its segment are skipped and logged,
+        as the length of the following records is unknown
+        :return: the item, None at the end of a segment or a corrupted record
+        """
+        end = self.segment_end(self.read_segment)
+        if self.read_offset < end:
+            if self.reader is None:
+                self.reader = open(self.segment_path(self.read_segment), 'rb')
+                self.reader.seek(self.read_offset)
+            header = self.reader.read(RECORD.size)
+            if len(header) == RECORD.size:
+                length, crc = RECORD.unpack(header)
+                if self.read_offset + RECORD.size + length <= end:
+                    payload = self.reader.read(length)
+                    if len(payload) == length and zlib.crc32(payload) == crc:
+                        self.read_offset += RECORD.size + length
+                        self.consumed += RECORD.size + length
+                        return json.loads(payload.decode('utf-8'))
+            self.skipped += end - self.read_offset
+            self.logger.error("[!] Corrupted record in {} at {}, skipped {} bytes to the end of the flushed records".format(
+                self.segment_path(self.read_segment), self.read_offset, end - self.read_offset))
+            self.consumed += end - self.read_offset
+            self.read_offset = end
+            self.reader.close()
+            self.reader = None
+        with self.cond:
+            finished = self.read_segment < self.flushed[0]
+        if finished:
+            # the end of a finished segment
+            if self.reader is not None:
+                self.reader.close()
+                self.reader = None
+            self.read_segment += 1
+            self.read_offset = 0
+        return None
+
+    def get(self, block=True, timeout=None):
+        """
+        get the next item, only called by the consumer
+        :param block: bool, wait for an item
+        :param timeout: float, max seconds to wait, None to wait forever
+        :return: the item
+        :raises queue.Empty: if no item is available
+        """
+        deadline = None if timeout is None else time() + timeout
+        while True:
+            with self.cond:
+                while (self.read_segment, self.read_offset) >= self.flushed:
+                    remaining = None if deadline is None else deadline - time()
+                    if not block or (remaining is not None and remaining <= 0):
+                        raise queue.Empty
+                    self.cond.wait(remaining)
+            item = self.read()
+            if item is not None:
+                return item
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def position(self):
+        """
+        :return: (segment, offset, bytes consumed) the position after the items got so far
+        """
+        return self.read_segment, self.read_offset, self.consumed
+
+    def commit(self, position):
+        """
+        commit a position, the items before it are not read again and their finished segments are removed
+        :param position: (segment, offset, bytes consumed) returned by position
+        """
+        if position <= self.committed:
+            return
+        path = os.path.join(self.directory, CURSOR_NAME)
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({'segment': position[0], 'offset': position[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        with self.cond:
+            self.size -= position[2] - self.committed[2]
+            self.committed = position
+            if self.size < self.max_bytes // 2:
+                self.full = False
+            # wake up the blocked put
+            self.cond.notify_all()
+        for segment in self.segments():
+            if segment >= position[0]:
+                break
+            os.remove(self.segment_path(segment))
+
+    def backlog(self):
+        """
+        :return: dict, bytes put but not committed, records in the buffer, bytes skipped by corrupted records,
+        times put blocked by a full queue
+        """
+        with self.cond:
+            return {'bytes': self.size, 'buffered': len(self.buffer), 'skipped': self.skipped,
+                    'blocked': self.blocked}
+
+
+class Checkpoint:
+    def __init__(self, queue_):
+        """
+        Commit the position of a durable queue once the items got before it are done downstream,
+        e.g. written by a bulk writer or flushed by another durable queue
+        :param queue_: DurableQueue
+        """
+        self.queue = queue_
+        # (mark, position), the items before the position are done once the downstream reaches the mark
+        self.marks = deque()
+
+    def hold(self, mark):
+        """
+        hold the current position of the queue until the downstream reaches a mark
+        :param mark: int, the downstream mark after the items got so far are handed to it
+        """
+        self.marks.append((mark, self.queue.position()))
+
+    def release(self, done):
+        """
+        commit the latest position the downstream is done with
+        :param done: int, the downstream mark reached
+        """
+        position = None
+        while self.marks and self.marks[0][0] <= done:
+            position = self.marks.popleft()[1]
+        if position is not None:
+            self.queue.commit(position)
+
+
+if __name__ == '__main__':
+    # testing code, items after the committed position are read again after a restart
+    import logging
+    import shutil
+
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger('durable_queue')
+    directory = '/tmp/durable_queue_test'
+    shutil.rmtree(directory, ignore_errors=True)
+    q = DurableQueue(directory, 4096, 0.05, 1 << 20, logger)
+    q.start()
+    for i in range(1000):
+        q.put({'id': i, 'text': 'status {}'.format(i)})
+    got = [q.get(timeout=5)['id'] for _ in range(600)]
+    assert got == list(range(600))
+    q.commit(q.position())
+    print("Segments: {}, backlog: {}".format(len(q.segments()), q.backlog()))
+
+    # a partial record written when the worker exited is truncated
+    with open(q.segment_path(q.segments()[-1]), 'ab') as f:
+        f.write(RECORD.pack(100, 0) + b'{"id"')
+    q = DurableQueue(directory, 4096, 0.05, 1 << 20, logger)
+    q.start()
+    got = [q.get(timeout=5)['id'] for _ in range(400)]
+    assert got == list(range(600, 1000))
+    try:
+        q.get(timeout=0.2)
+        assert False
+    except queue.Empty:
+        pass
+    print("Replayed {} uncommitted items".format(len(got)))
+
+    # a corrupted record skips the rest of its segment, the skipped bytes are logged and counted
+    shutil.rmtree(directory, ignore_errors=True)
+    q = DurableQueue(directory, 4096, 0.05, 1 << 20, logger)
+    q.start()
+    for i in range(200):
+        q.put({'id': i, 'text': 'status {}'.format(i)})
+        q.flush()
+    first = q.segments()[0]
+    with open(q.segment_path(first), 'r+b') as f:
+        f.seek(RECORD.size)
+        f.write(b'X')
+    got = []
+    try:
+        while True:
+            got.append(q.get(timeout=0.2)['id'])
+    except queue.Empty:
+        pass
+    assert got == list(range(200 - len(got), 200)) and q.backlog()['skipped'] == os.path.getsize(q.segment_path(first))
+    q.commit(q.position())
+    assert q.backlog()['bytes'] == 0
+    print("Skipped {} bytes of a corrupted segment, read {} items after it".format(q.backlog()['skipped'], len(got)))
+
+    # put blocks once max_bytes are not committed, and resumes after the consumer commits
+    shutil.rmtree(directory, ignore_errors=True)
+    q = DurableQueue(directory, 4096, 0.05, 2000, logger)
+    q.start()
+    producer = threading.Thread(target=lambda: [q.put({'id': i}) for i in range(500)])
+    producer.start()
+    producer.join(0.5)
+    assert producer.is_alive() and q.put_count < 500 and q.backlog()['blocked'] >= 1
+    got = []
+    while len(got) < 500:
+        got.append(q.get(timeout=5)['id'])
+        q.commit(q.position())
+    producer.join()
+    assert got == list(range(500)) and q.backlog()['bytes'] == 0
+    print("Put blocked {} times under a limit of {} bytes".format(q.backlog()['blocked'], q.max_bytes))
@@ -0,0 +1,174 @@
+"""
+@author Team 42, Chengdu, China, Qifan Deng, 1077479
+"""
+import multiprocessing
+import numpy as np
+
+from math import ceil
+from utils.config import Config
+from utils.geocoder import create_geocoder, PlaceGeocoder
+from utils.geometry import AreaStore
+from utils.logger import get_logger
+from utils.sentiment import SentimentEngine
+from utils.topics import TopicTagger
+
+
+class Enricher:
+    def __init__(self, geocoder, place_geocoder=None, sentiment_cache_capacity=0, nltk_data_path=None):
+        """
+        Locate tweets, score their sentiment and tag their topics
+        :param geocoder: a geocoder created by create_geocoder
+        :param place_geocoder: PlaceGeocoder, tweets without a point are located by their place if given
+        :param sentiment_cache_capacity: int, max number of cached sentiment scores, 0 disables the cache
+        :param nltk_data_path: str, local nltk data directory of the sentiment lexicon
+        """
+        self.geocoder = geocoder
+        self.place_geocoder = place_geocoder
+        self.sentiment = SentimentEngine(sentiment_cache_capacity, nltk_data_path)
+        self.topics = TopicTagger()
+
+    @classmethod
+    def from_config(cls, config, logger=None):
+        """
+        map the compiled areas and create the configured geocoders
+        :param config: Config, harvest config
+        :param logger: logger to report compiling
+        :return: Enricher
+        """
+        store = AreaStore.compiled(config.aus_sa2_2016_lv12_path, config.aus_sa2_2016_lv12_artifact_path, logger)
+        place_geocoder = None
+        if config.geocoding_places:
+            place_geocoder = PlaceGeocoder(store, config.geocoding_place_max_size,
+                                           config.geocoding_place_cache_capacity)
+        return cls(create_geocoder(config, store, logger), place_geocoder, config.sentiment_cache_capacity,
+                   config.nltk_data_path)
+
+    def locate(self, statuses):
+        """
+        find the areas where a batch of tweets are located
+        :param statuses: list, tweet json or compact records, only coordinates and place are used
+        :return: list, (area index, whether it is located by place) of each tweet, area index is -1 if not located
+        """
+        res = [(-1, False)] * len(statuses)
+        points = []
+        located = []
+        for i, status in enumerate(statuses):
+            if status['coordinates'] is not None and status['coordinates']['type'] == 'Point':
+                points.append(status['coordinates']['coordinates'])
+                located.append(i)
+            elif self.place_geocoder is not None:
+                # only the place bounding box is known, use the area that overlaps most with it
+                area_idx = self.place_geocoder.locate_place(status.get('place'))
+                if area_idx >= 0:
+                    res[i] = (area_idx, True)
+        for i, area_idx in zip(located, self.geocoder.locate_batch(points).tolist()):
+            res[i] = (area_idx, False)
+        return res
+
+    def enrich(self, records):
+        """
+        locate a batch of tweets, score their sentiment and tag their topics
+        :param records: list, compact records made by EnrichmentPool.compact
+        :return: list, (area index, whether it is located by place, sentiment scores, topics) of each tweet
+        """
+        sentiments = self.sentiment.score_batch([record['full_text'] for record in records])
+        return [(area_idx, by_place, sent_scores, self.topics.tag(record['full_text']))
+                for (area_idx, by_place), sent_scores, record in zip(self.locate(records), sentiments, records)]
+
+
+# the enricher of an enrichment process
+process_enricher = None
+
+
+def init_process(log_level):
+    """
+    initialise an enrichment process, the compiled areas are mapped rather than copied
+    :param log_level: logging level
+    """
+    global process_enricher
+    process_enricher = Enricher.from_config(Config(log_level), get_logger('Enrichment', log_level))
+
+
+def enrich_records(records):
+    """
+    enrich records in an enrichment process
+    :param records: list, compact records
+    :return: list, (area index, whether it is located by place, sentiment scores, topics) of each record
+    """
+    return process_enricher.enrich(records)
+
+
+class EnrichmentPool:
+    def __init__(self, log_level, size, fallback, store, timeout, logger):
+        """
+        A pool of processes that locate tweets, score their sentiment and tag their topics, so that the cpu work
+        runs on all cores rather than under the GIL of the worker.
+        A batch not enriched in timeout seconds, e.g. a process is killed and its task is never completed,
+        is enriched by the fallback enricher in the calling process and the pool is rebuilt.
+        :param log_level: logging level
+        :param size: int, number of processes
+        :param fallback: Enricher, the enricher of the calling process
+        :param store: AreaStore, the areas of the calling process, the processes have their own hit counters
+        :param timeout: float, max seconds to enrich a batch in the pool
+        :param logger: logger to report the timeouts
+        """
+        self.log_level = log_level
+        self.size = size
+        self.fallback = fallback
+        self.store = store
+        self.timeout = timeout
+        self.logger = logger
+        self.timeouts = 0
+        self.pool = multiprocessing.Pool(size, init_process, (log_level,))
+
+    @staticmethod
+    def compact(doc):
+        """
+        keep only the fields of a tweet that enrichment needs, to reduce the pickling cost
+        :param doc: tweet json
+        :return: dict, compact record
+        """
+        place = doc.get('place')
+        if place:
+            place = {'id': place['id'], 'bounding_box': place.get('bounding_box')}
+        return {'coordinates': doc['coordinates'], 'place': place, 'full_text': doc['full_text']}
+
+    def enrich(self, docs):
+        """
+        enrich a batch of tweets, the batch is split evenly to the processes
+        :param docs: list, tweet json
+        :return: list, (area index, whether it is located by place, sentiment scores, topics) of each tweet
+        """
+        records = [self.compact(doc) for doc in docs]
+        if not records:
+            return []
+        chunk_size = ceil(len(records) / self.size)
+        res = []
+        try:
+            chunks = self.pool.map_async(enrich_records, [records[i:i + chunk_size]
+                                                          for i in range(0, len(records), chunk_size)]
+                                         ).get(self.timeout)
+        except multiprocessing.TimeoutError:
+            self.timeouts += 1
+            self.logger.warning("[!] Enrichment of {} tweets timed out in {} seconds, "
+                                "enrich them in the worker and rebuild the pool".format(len(records), self.timeout))
+            self.rebuild()
+            # the hits are recorded by the geocoders of the fallback
+            return self.fallback.enrich(records)
+        for chunk in chunks:
+            res.extend(chunk)
+        self.store.record_hits(np.asarray([area_idx for area_idx, _, _, _ in res], dtype=np.int64))
+        return res
+
+    def rebuild(self):
+        """
+        replace the processes, a task of a dead process is never completed by multiprocessing.Pool
+        """
+        self.pool.terminate()
+        self.pool = multiprocessing.Pool(self.size, init_process, (self.log_level,))
+
+    def close(self):
+        """
+        stop the processes
+        """
+        self.pool.terminate()
@@ -0,0 +1,576 @@
+"""
+@author Team 42, Chengdu, China, Qifan Deng, 1077479
+"""
+import os
+import numpy as np
+
+from utils.cache import LRUCache
+from utils.geometry import clip_ring, polygon_area, read_artifact, write_artifact
+from utils.spatial_index import STRTree
+
+
+class Geocoder:
+    # max number of points to ray cast at once
+    chunk_size = 256
+
+    def __init__(self, store):
+        """
+        A batch point-in-polygon geocoder, Ray Casting runs on the flat arrays of the area store
+        rather than nested lists
+        :param store: AreaStore, the areas
+        """
+        self.store = store
+        # only the few rings whose bounding box contains a point are tested
+        self.index = STRTree(store.bboxes)
+
+    def candidates(self, xs, ys):
+        """
+        find the rings whose bounding box contains the points
+        :param xs: numpy array, longitudes
+        :param ys: numpy array, latitudes
+        :return: (point indexes, ring indexes), both sorted by point then ring
+        """
+        return self.index.query_points(xs, ys)
+
+    def crossings(self, xs, ys, point_idx, ring_idx, store=None, tolerance=None):
+        """
+        count the crossings of a ray cast from each point against each candidate ring
+        :param xs: numpy array, longitudes
+        :param ys: numpy array, latitudes
+        :param point_idx: numpy array, point index of each (point, ring) pair
+        :param ring_idx: numpy array, ring index of each (point, ring) pair
+        :param store: AreaStore, the rings to cast against, the areas of this geocoder if not given
+        :param tolerance: float, if given, also find the pairs whose point is within this distance of the ring
+        :return: numpy array, crossing count of each pair; and numpy array, whether the point is near the ring,
+        if tolerance is given
+        """
+        store = self.store if store is None else store
+        lens = store.ring_len[ring_idx]
+        ends = np.cumsum(lens)
+        # expand every pair to the edges of its ring
+        edge_idx = np.arange(ends[-1]) - np.repeat(ends - lens, lens) + np.repeat(store.ring_offsets[ring_idx], lens)
+        px = np.repeat(xs[point_idx], lens)
+        py = np.repeat(ys[point_idx], lens)
+        x0, y0 = store.coordinates[edge_idx, 0], store.coordinates[edge_idx, 1]
+        previous = store.previous(edge_idx, np.repeat(ring_idx, lens))
+        x1, y1 = store.coordinates[previous, 0], store.coordinates[previous, 1]
+        # https://stackoverflow.com/questions/217578
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crossed = ((y0 > py) != (y1 > py)) & (px < (x1 - x0) * (py - y0) / (y1 - y0) + x0)
+        counts = np.add.reduceat(crossed.astype(np.int64), ends - lens)
+        if tolerance is None:
+            return counts
+
+        # squared distance from the point to the nearest point of each edge
+        dx, dy = x1 - x0, y1 - y0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.nan_to_num(np.clip(((px - x0) * dx + (py - y0) * dy) / (dx * dx + dy * dy), 0, 1))
+        distances = (px - x0 - t * dx) ** 2 + (py - y0 - t * dy) ** 2
+        return counts, np.minimum.reduceat(distances, ends - lens) <= tolerance * tolerance
+
+    def locate_batch(self, points):
+        """
+        find the areas where the points are located
+        :param points: array like, [(longitude, latitude)]
+        :return: numpy array, area index of each point, -1 if it is not in any area
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        res = self.locate_points(points[:, 0], points[:, 1])
+        self.record_hits(res)
+        return res
+
+    def locate_points(self, xs, ys):
+        """
+        find the areas where the points are located, without recording hits
+        :param xs: numpy array, longitudes
+        :param ys: numpy array, latitudes
+        :return: numpy array, area index of each point, -1 if it is not in any area
+        """
+        if len(xs) > self.chunk_size:
+            # bound the memory used by the expanded edges
+            return np.concatenate([self.locate_points(xs[i:i + self.chunk_size], ys[i:i + self.chunk_size])
+                                   for i in range(0, len(xs), self.chunk_size)])
+        res = np.full(len(xs), -1, dtype=np.int64)
+        point_idx, ring_idx = self.candidates(xs, ys)
+        if not len(point_idx):
+            return res
+
+        # a point is inside an area if the crossings of all the rings of this area is odd
+        n_areas = len(self.store)
+        keys = point_idx * n_areas + self.store.ring_area[ring_idx]
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        crossings = np.bincount(inverse, weights=self.crossings(xs, ys, point_idx, ring_idx))
+        inside = unique_keys[crossings.astype(np.int64) % 2 == 1]
+        # keys are sorted, so the first key of a point is the first area it is located in
+        located_points, first = np.unique(inside // n_areas, return_index=True)
+        res[located_points] = inside[first] % n_areas
+        return res
+
+    def locate(self, x, y):
+        """
+        find the area where a point is located
+        :param x: float, longitude
+        :param y: float, latitude
+        :return: int, area index, -1 if it is not in any area
+        """
+        return int(self.locate_batch([(x, y)])[0])
+
+    def record_hits(self, area_idxs):
+        """
+        record hit times of the located areas
+        :param area_idxs: numpy array, area indexes, -1 is ignored
+        """
+        self.store.record_hits(area_idxs)
+
+    def area(self, area_idx):
+        """
+        :param area_idx: int, area index
+        :return: Area, the area record
+        """
+        return self.store.areas[area_idx]
+
+
+class SimplifiedGeocoder(Geocoder):
+    def __init__(self, store, simplified, tolerance):
+        """
+        A two-tier geocoder, points are cast against the simplified rings first, which is accepted
+        if a point is further than the tolerance from the simplified ring.
+        Only points in this boundary band are cast against the full resolution rings
+        :param store: AreaStore, the areas
+        :param simplified: AreaStore, the areas simplified by Douglas-Peucker with the tolerance
+        :param tolerance: float, the simplifying tolerance in degree
+        """
+        super().__init__(store)
+        self.simplified = simplified
+        self.tolerance = tolerance
+        # number of (point, ring) pairs tested and that fell back to the full resolution rings
+        self.tested = 0
+        self.fallbacks = 0
+
+    @classmethod
+    def compiled(cls, store, tolerance, artifact_path, logger=None):
+        """
+        map the compiled simplified areas, they are simplified again only when the areas or tolerance change
+        :param store: AreaStore, the areas
+        :param tolerance: float, the simplifying tolerance in degree
+        :param artifact_path: artifact path
+        :param logger: logger to report compiling
+        :return: SimplifiedGeocoder
+        """
+        header = {'source_hash': store.source_hash, 'tolerance': tolerance}
+        if header['source_hash'] is not None and os.path.isfile(artifact_path):
+            artifact = read_artifact(artifact_path)
+            if artifact is not None and artifact[0] == header:
+                arrays = artifact[1]
+                return cls(store, store.with_coordinates(arrays['coordinates'], arrays['ring_offsets']), tolerance)
+
+        simplified = store.simplify(tolerance)
+        if header['source_hash'] is not None:
+            try:
+                write_artifact(artifact_path, header, {'coordinates': simplified.coordinates,
+                                                       'ring_offsets': simplified.ring_offsets})
+                if logger:
+                    logger.info("[*] Compiled simplified areas to {}".format(artifact_path))
+            except OSError as e:
+                if logger:
+                    logger.warning("[!] Cannot compile simplified areas to {}: {}".format(artifact_path, e))
+        return cls(store, simplified, tolerance)
+
+    def crossings(self, xs, ys, point_idx, ring_idx, store=None, tolerance=None):
+        """
+        count the crossings of a ray cast from each point against each candidate ring
+        :param xs: numpy array, longitudes
+        :param ys: numpy array, latitudes
+        :param point_idx: numpy array, point index of each (point, ring) pair
+        :param ring_idx: numpy array, ring index of each (point, ring) pair
+        :param store: not used, rings are always the simplified ones then the full resolution ones
+        :param tolerance: not used
+        :return: numpy array, crossing count of each pair
+        """
+        counts, near = super().crossings(xs, ys, point_idx, ring_idx, self.simplified, self.tolerance)
+        if near.any():
+            counts[near] = super().crossings(xs, ys, point_idx[near], ring_idx[near])
+        self.tested += len(near)
+        self.fallbacks += int(near.sum())
+        return counts
+
+
+class GridGeocoder:
+    # cell labels besides area indexes
+    NO_AREA = -1
+    BOUNDARY = -2
+
+    def __init__(self, geocoder, bbox, cell_size, subdivision, labels=None):
+        """
+        A geocoder that pre-rasterizes the areas onto a grid, a cell fully inside an area is mapped to it directly.
+        Boundary cells are subdivided into blocks of finer cells, only boundary fine cells fall back to Ray Casting
+        :param geocoder: Geocoder, the exact geocoder
+        :param bbox: list, [min_x, min_y, max_x, max_y] of the grid
+        :param cell_size: float, cell size of the grid in degree
+        :param subdivision: int, number of fine cells per side of a boundary cell
+        :param labels: tuple, (cells, blocks_idx, blocks) of a compiled grid, rasterized if not given
+        """
+        self.geocoder = geocoder
+        self.origin = np.asarray(bbox[:2], dtype=np.float64)
+        self.cell_size = cell_size
+        self.subdivision = subdivision
+        self.fine_size = cell_size / subdivision
+        self.nx = int(np.ceil((bbox[2] - bbox[0]) / cell_size))
+        self.ny = int(np.ceil((bbox[3] - bbox[1]) / cell_size))
+
+        if labels is not None:
+            self.cells, self.blocks_idx, self.blocks = labels
+            return
+
+        # a cell touched by any edge is a boundary cell, both grids are marked from the fine cells
+        # so that the fine cells of a boundary cell are always in its block
+        sub = self.subdivision
+        fx, fy = self.edge_cells()
+        boundary = np.zeros((self.ny, self.nx), dtype=bool)
+        boundary[fy // sub, fx // sub] = True
+        self.cells = self.label(boundary, np.arange(self.ny), self.cell_size,
+                                np.column_stack([np.zeros(self.ny), np.arange(self.ny) * self.cell_size]))
+
+        # blocks of fine cells of boundary cells
+        block_cy, block_cx = np.nonzero(boundary)
+        self.blocks_idx = np.full((self.ny, self.nx), -1, dtype=np.int32)
+        self.blocks_idx[block_cy, block_cx] = np.arange(len(block_cy))
+        # blocks are stacked vertically, so a fine cell (block, row, col) is at (block * sub + row, col)
+        fine_boundary = np.zeros((len(block_cy) * sub, sub), dtype=bool)
+        fine_boundary[self.blocks_idx[fy // sub, fx // sub] * sub + fy % sub, fx % sub] = True
+        rows_block = np.repeat(np.arange(len(block_cy)), sub)
+        rows_origin = np.column_stack([block_cx[rows_block] * self.cell_size,
+                                       block_cy[rows_block] * self.cell_size
+                                       + np.tile(np.arange(sub), len(block_cy)) * self.fine_size])
+        self.blocks = self.label(fine_boundary, rows_block, self.fine_size, rows_origin)
+
+    @classmethod
+    def compiled(cls, geocoder, bbox, cell_size, subdivision, artifact_path, logger=None):
+        """
+        map the compiled grid, it is rasterized again only when the areas or grid parameters change
+        :param geocoder: Geocoder, the exact geocoder
+        :param bbox: list, [min_x, min_y, max_x, max_y] of the grid
+        :param cell_size: float, cell size of the grid in degree
+        :param subdivision: int, number of fine cells per side of a boundary cell
+        :param artifact_path: artifact path
+        :param logger: logger to report compiling
+        :return: GridGeocoder
+        """
+        header = {'source_hash': geocoder.store.source_hash, 'bbox': list(bbox), 'cell_size': cell_size,
+                  'subdivision': subdivision}
+        if header['source_hash'] is not None and os.path.isfile(artifact_path):
+            artifact = read_artifact(artifact_path)
+            if artifact is not None and artifact[0] == header:
+                arrays = artifact[1]
+                return cls(geocoder, bbox, cell_size, subdivision,
+                           (arrays['cells'], arrays['blocks_idx'], arrays['blocks']))
+
+        grid = cls(geocoder, bbox, cell_size, subdivision)
+        if header['source_hash'] is None:
+            return grid
+        try:
+            write_artifact(artifact_path, header,
+                           {'cells': grid.cells, 'blocks_idx': grid.blocks_idx, 'blocks': grid.blocks})
+            if logger:
+                logger.info("[*] Compiled geocoding grid to {}".format(artifact_path))
+        except OSError as e:
+            if logger:
+                logger.warning("[!] Cannot compile geocoding grid to {}: {}".format(artifact_path, e))
+        return grid
+
+    def edge_cells(self):
+        """
+        find the fine cells that any edge passes through
+        :return: (column indexes, row indexes) of the fine cells, may contain duplicates
+        """
+        x0, y0, x1, y1 = self.geocoder.store.edges()
+        # cut edges into pieces no longer than half a cell, so a piece touches at most 2 x 2 cells
+        pieces = np.maximum(np.ceil(np.hypot(x1 - x0, y1 - y0) / (self.fine_size / 2)).astype(np.int64), 1)
+        edge_idx = np.repeat(np.arange(len(pieces)), pieces)
+        ends = np.cumsum(pieces)
+        t0 = (np.arange(ends[-1]) - np.repeat(ends - pieces, pieces)) / pieces[edge_idx]
+        t1 = t0 + 1 / pieces[edge_idx]
+        dx, dy = (x1 - x0)[edge_idx], (y1 - y0)[edge_idx]
+        xa, xb = x0[edge_idx] + dx * t0, x0[edge_idx] + dx * t1
+        ya, yb = y0[edge_idx] + dy * t0, y0[edge_idx] + dy * t1
+        # expand a little to be conservative with rounding errors
+        eps = 1e-9
+        ix0, iy0 = self.fine_cell_of(np.minimum(xa, xb) - eps, np.minimum(ya, yb) - eps)
+        ix1, iy1 = self.fine_cell_of(np.maximum(xa, xb) + eps, np.maximum(ya, yb) + eps)
+        fx = np.concatenate([ix0, ix0, ix1, ix1])
+        fy = np.concatenate([iy0, iy1, iy0, iy1])
+        in_grid = (fx >= 0) & (fy >= 0) & (fx < self.nx * self.subdivision) & (fy < self.ny * self.subdivision)
+        return fx[in_grid], fy[in_grid]
+
+    def fine_cell_of(self, xs, ys):
+        """
+        :param xs: numpy array, longitudes
+        :param ys: numpy array, latitudes
+        :return: (column indexes, row indexes) of the fine cells where the points are
+        """
+        return np.floor((xs - self.origin[0]) / self.fine_size).astype(np.int64), \
+            np.floor((ys - self.origin[1]) / self.fine_size).astype(np.int64)
+
+    def label(self, boundary, rows_group, size, rows_origin):
+        """
+        label the cells, cells connected without passing a boundary cell are in the same area,
+        so Ray Casting is only run once for each connected component
+        :param boundary: numpy 2d array, whether a cell is a boundary cell
+        :param rows_group: numpy array, group of each row, rows in different groups are not connected
+        :param size: float, cell size
+        :param rows_origin: numpy 2d array, offset of the lower left corner of each row to the grid origin
+        :return: numpy 2d array, area index of each cell, or NO_AREA or BOUNDARY
+        """
+        labels = np.full(boundary.shape, self.BOUNDARY, dtype=np.int32)
+        # runs of consecutive non-boundary cells in each row
+        free = np.pad(~boundary, ((0, 0), (1, 1))).astype(np.int8)
+        diff = np.diff(free, axis=1)
+        run_row, run_start = np.nonzero(diff == 1)
+        run_end = np.nonzero(diff == -1)[1]
+        if not len(run_row):
+            return labels
+
+        # union runs that overlap with a run of the next row in the same group
+        parents = list(range(len(run_row)))
+
+        def find(i):
+            while parents[i] != i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+            return i
+
+        row_first = np.searchsorted(run_row, np.arange(boundary.shape[0] + 1))
+        for row in range(boundary.shape[0] - 1):
+            if rows_group[row] != rows_group[row + 1]:
+                continue
+            i, i_end = row_first[row], row_first[row + 1]
+            j, j_end = i_end, row_first[row + 2]
+            while i < i_end and j < j_end:
+                if run_start[i] < run_end[j] and run_start[j] < run_end[i]:
+                    parents[find(i)] = find(j)
+                if run_end[i] < run_end[j]:
+                    i += 1
+                else:
+                    j += 1
+
+        roots = np.asarray([find(i) for i in range(len(run_row))])
+        components, representative, inverse = np.unique(roots, return_index=True, return_inverse=True)
+        # locate the centre of the first cell of each component
+        xs = self.origin[0] + rows_origin[run_row[representative], 0] + (run_start[representative] + 0.5) * size
+        ys = self.origin[1] + rows_origin[run_row[representative], 1] + 0.5 * size
+        runs_label = self.geocoder.locate_points(xs, ys)[inverse.reshape(-1)]
+        lengths = run_end - run_start
+        cells_row = np.repeat(run_row, lengths)
+        ends = np.cumsum(lengths)
+        cells_col = np.arange(ends[-1]) - np.repeat(ends - lengths, lengths) + np.repeat(run_start, lengths)
+        labels[cells_row, cells_col] = np.repeat(runs_label, lengths)
+        return labels
+
+    def locate_batch(self, points):
+        """
+        find the areas where the points are located
+        :param points: array like, [(longitude, latitude)]
+        :return: numpy array, area index of each point, -1 if it is not in any area
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        res = self.locate_points(points[:, 0], points[:, 1])
+        self.record_hits(res)
+        return res
+
+    def locate_points(self, xs, ys):
+        """
+        find the areas where the points are located, without recording hits
+        :param xs: numpy array, longitudes
+        :param ys: numpy array, latitudes
+        :return: numpy array, area index of each point, -1 if it is not in any area
+        """
+        res = np.full(len(xs), self.BOUNDARY, dtype=np.int64)
+        sub = self.subdivision
+        fx, fy = self.fine_cell_of(xs, ys)
+        in_grid = np.nonzero((fx >= 0) & (fy >= 0) & (fx < self.nx * sub) & (fy < self.ny * sub))[0]
+        fx, fy = fx[in_grid], fy[in_grid]
+        res[in_grid] = self.cells[fy // sub, fx // sub]
+
+        in_block = res[in_grid] == self.BOUNDARY
+        fx, fy = fx[in_block], fy[in_block]
+        block = self.blocks_idx[fy // sub, fx // sub]
+        res[in_grid[in_block]] = self.blocks[block * sub + fy % sub, fx % sub]
+
+        # boundary fine cells and points out of the grid
+        exact = np.nonzero(res == self.BOUNDARY)[0]
+        if len(exact):
+            res[exact] = self.geocoder.locate_points(xs[exact], ys[exact])
+        return res
+
+    def locate(self, x, y):
+        """
+        find the area where a point is located
+        :param x: float, longitude
+        :param y: float, latitude
+        :return: int, area index, -1 if it is not in any area
+        """
+        return int(self.locate_batch([(x, y)])[0])
+
+    def record_hits(self, area_idxs):
+        """
+        record hit times of the located areas
+        :param area_idxs: numpy array, area indexes, -1 is ignored
+        """
+        self.geocoder.record_hits(area_idxs)
+
+    def area(self, area_idx):
+        """
+        :param area_idx: int, area index
+        :return: Area, the area record
+        """
+        return self.geocoder.area(area_idx)
+
+
+class CachedGeocoder:
+    def __init__(self, geocoder, precision, capacity):
+        """
+        A geocoder behind a LRU cache keyed by rounded coordinates,
+        tweets posted from the same spot skip polygon testing
+        :param geocoder: Geocoder or GridGeocoder
+        :param precision: int, number of decimals the coordinates are rounded to
+        :param capacity: int, max number of cached coordinates
+        """
+        self.geocoder = geocoder
+        self.precision = precision
+        self.cache = LRUCache(capacity)
+
+    def locate_batch(self, points):
+        """
+        find the areas where the points are located
+        :param points: array like, [(longitude, latitude)]
+        :return: numpy array, area index of each point, -1 if it is not in any area
+        """
+        points = np.round(np.asarray(points, dtype=np.float64).reshape(-1, 2), self.precision)
+        res = np.full(len(points), -1, dtype=np.int64)
+        # indexes of the points of each missed key
+        missed = {}
+        for i, key in enumerate(map(tuple, points.tolist())):
+            area_idx = self.cache.get(key)
+            if area_idx is None:
+                missed.setdefault(key, []).append(i)
+            else:
+                res[i] = area_idx
+
+        if missed:
+            keys = np.asarray(list(missed.keys()), dtype=np.float64)
+            located = self.geocoder.locate_points(keys[:, 0], keys[:, 1])
+            for (key, idxs), area_idx in zip(missed.items(), located.tolist()):
+                res[idxs] = area_idx
+                self.cache.put(key, area_idx)
+        self.geocoder.record_hits(res)
+        return res
+
+    def locate(self, x, y):
+        """
+        find the area where a point is located
+        :param x: float, longitude
+        :param y: float, latitude
+        :return: int, area index, -1 if it is not in any area
+        """
+        return int(self.locate_batch([(x, y)])[0])
+
+    def area(self, area_idx):
+        """
+        :param area_idx: int, area index
+        :return: Area, the area record
+        """
+        return self.geocoder.area(area_idx)
+
+
+class PlaceGeocoder:
+    def __init__(self, store, max_size, capacity):
+        """
+        A geocoder of tweet places, a place is resolved to the area that overlaps most with its bounding box,
+        the result is cached by place id so a place is resolved only once
+        :param store: AreaStore, the areas
+        :param max_size: float, max width and height in degree of a place to resolve,
+        a larger place, e.g. a metropolis, a state or the country, is not specific to an area
+        :param capacity: int, max number of cached places
+        """
+        self.geocoder = Geocoder(store)
+        self.store = store
+        self.max_size = max_size
+        self.cache = LRUCache(capacity)
+        # the first ring of a polygon is its exterior, the others are holes
+        self.exterior = np.zeros(len(store.ring_len), dtype=bool)
+        self.exterior[store.polygon_offsets[:-1]] = True
+
+    def resolve(self, bbox):
+        """
+        find the area that overlaps most with a bounding box
+        :param bbox: [min_x, min_y, max_x, max_y]
+        :return: int, area index, -1 if it does not overlap any area
+        """
+        if bbox[0] == bbox[2] or bbox[1] == bbox[3]:
+            # a point of interest has a degenerated bounding box, its hit is recorded by locate_place
+            return int(self.geocoder.locate_points(np.asarray([(bbox[0] + bbox[2]) / 2]),
+                                                   np.asarray([(bbox[1] + bbox[3]) / 2]))[0])
+
+        _, ring_idxs = self.geocoder.index.query_bboxes([bbox])
+        overlaps = {}
+        for ring_idx in ring_idxs.tolist():
+            ring = self.store.coordinates[self.store.ring_offsets[ring_idx]:self.store.ring_offsets[ring_idx + 1]]
+            overlap = polygon_area(clip_ring(ring, bbox))
+            area_idx = int(self.store.ring_area[ring_idx])
+            overlaps[area_idx] = overlaps.get(area_idx, 0) + (overlap if self.exterior[ring_idx] else -overlap)
+        res, max_overlap = -1, 0
+        for area_idx in sorted(overlaps):
+            if overlaps[area_idx] > max_overlap:
+                res, max_overlap = area_idx, overlaps[area_idx]
+        return res
+
+    def locate_place(self, place):
+        """
+        find the area of a tweet place
+        :param place: dict, place object of a tweet
+        https://developer.twitter.com/en/docs/tweets/data-dictionary/overview/geo-objects
+        :return: int, area index, -1 if the place is too large or it does not overlap any area
+        """
+        if not place or not place.get('bounding_box'):
+            return -1
+        area_idx = self.cache.get(place['id'])
+        if area_idx is None:
+            coordinates = np.asarray(place['bounding_box']['coordinates'], dtype=np.float64).reshape(-1, 2)
+            bbox = np.concatenate([coordinates.min(axis=0), coordinates.max(axis=0)]).tolist()
+            if bbox[2] - bbox[0] > self.max_size or bbox[3] - bbox[1] > self.max_size:
+                area_idx = -1
+            else:
+                area_idx = self.resolve(bbox)
+            self.cache.put(place['id'], area_idx)
+        self.store.record_hits(np.asarray([area_idx]))
+        return area_idx
+
+    def area(self, area_idx):
+        """
+        :param area_idx: int, area index
+        :return: Area, the area record
+        """
+        return self.store.areas[area_idx]
+
+
+def create_geocoder(config, store, logger=None):
+    """
+    create the geocoder of the configured mode
+    :param config: Config, harvest config
+    :param store: AreaStore, the areas
+    :param logger: logger to report compiling
+    :return: Geocoder if the mode is 'exact', GridGeocoder if it is 'grid', SimplifiedGeocoder if it is 'simplified',
+    behind a CachedGeocoder if the cache capacity is positive
+    """
+    if config.geocoding_mode == 'simplified':
+        geocoder = SimplifiedGeocoder.compiled(store, config.geocoding_simplify_tolerance,
+                                               config.geocoding_simplified_artifact_path, logger)
+    else:
+        geocoder = Geocoder(store)
+    if config.geocoding_mode == 'grid':
+        geocoder = GridGeocoder.compiled(geocoder, config.australia_bbox, config.geocoding_grid_cell_size,
+                                         config.geocoding_grid_subdivision, config.geocoding_grid_artifact_path,
+                                         logger)
+    if config.geocoding_cache_capacity > 0:
+        geocoder = CachedGeocoder(geocoder, config.geocoding_cache_precision, config.geocoding_cache_capacity)
+    return geocoder
@@ -0,0 +1,384 @@
+"""
+@author Team 42, Chengdu, China, Qifan Deng, 1077479
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import numpy as np
+
+ARTIFACT_MAGIC = b'SA2STORE'
+# increase it whenever the layout of artifacts changes
+ARTIFACT_VERSION = 1
+
+
+class Area:
+    __slots__ = ('code', 'name', 'state')
+
+    def __init__(self, code, name, state):
+        """
+        A SA2 area record
+        :param code: str, SA2 feature code
+        :param name: str, SA2 feature name
+        :param state: str, state name
+        """
+        self.code = code
+        self.name = name
+        self.state = state
+
+
+def read_areas(path):
+    """
+    read areas from file
+    :param path: directory path, one GeoJSON file of a state
+    :return: dict, state name -> features
+    """
+    areas_collection = {}
+    for filename in sorted(os.listdir(path)):
+        abs_path = os.path.join(path, filename)
+        if os.path.isfile(abs_path):
+            with open(abs_path) as f:
+                areas_collection[filename[:filename.find('.')]] = json.loads(f.read())['features']
+    return areas_collection
+
+
+def source_hash(path):
+    """
+    hash the content of the GeoJSON files of states
+    :param path: directory path, one GeoJSON file of a state
+    :return: str, sha256 hex digest
+    """
+    h = hashlib.sha256()
+    for filename in sorted(os.listdir(path)):
+        abs_path = os.path.join(path, filename)
+        if os.path.isfile(abs_path):
+            h.update(bytes(filename, 'utf-8'))
+            with open(abs_path, 'rb') as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def write_artifact(path, header, arrays):
+    """
+    write arrays to a binary artifact: magic, version, header length, json header, then 8 bytes aligned arrays.
+    It is written to a temporary file then renamed, so readers never see a partial artifact
+    :param path: artifact path
+    :param header: dict, json serializable header
+    :param arrays: dict, name -> numpy array
+    """
+    header = dict(header)
+    header['arrays'] = {}
+    offset = 0
+    for name, array in arrays.items():
+        header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += (array.nbytes + 7) // 8 * 8
+    header_bytes = bytes(json.dumps(header), 'utf-8')
+    header_bytes += b' ' * (-(len(ARTIFACT_MAGIC) + 8 + len(header_bytes)) % 8)
+
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(ARTIFACT_MAGIC + struct.pack('<II', ARTIFACT_VERSION, len(header_bytes)) + header_bytes)
+        for array in arrays.values():
+            data = np.ascontiguousarray(array).tobytes()
+            f.write(data + b'\0' * (-len(data) % 8))
+    os.replace(tmp_path, path)
+
+
+def read_artifact(path):
+    """
+    map a binary artifact read-only, processes mapping the same artifact share its physical memory
+    :param path: artifact path
+    :return: (dict header, dict name -> read-only numpy array), None if it is not a valid artifact
+    """
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    prefix_len = len(ARTIFACT_MAGIC) + 8
+    if len(buffer) < prefix_len or buffer[:len(ARTIFACT_MAGIC)] != ARTIFACT_MAGIC:
+        return None
+    version, header_len = struct.unpack('<II', buffer[len(ARTIFACT_MAGIC):prefix_len])
+    if version != ARTIFACT_VERSION:
+        return None
+    header = json.loads(buffer[prefix_len:prefix_len + header_len].decode('utf-8'))
+    arrays = {}
+    for name, meta in header.pop('arrays').items():
+        dtype = np.dtype(meta['dtype'])
+        count = int(np.prod(meta['shape']))
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count,
+                                     offset=prefix_len + header_len + meta['offset']).reshape(meta['shape'])
+    return header, arrays
+
+
+def douglas_peucker(ring, tolerance):
+    """
+    simplify a ring by Douglas-Peucker, every removed vertex is within the tolerance of the simplified ring
+    https://en.wikipedia.org/wiki/Ramer%E2%80%93Douglas%E2%80%93Peucker_algorithm
+    :param ring: numpy array, (n, 2) vertices
+    :param tolerance: float, max distance from a removed vertex to the simplified segment
+    :return: numpy array, indexes of the kept vertices
+    """
+    keep = np.zeros(len(ring), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(ring) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = ring[first], ring[last]
+        points = ring[first + 1:last]
+        # distance to the segment rather than the line, so it also works for closed rings
+        d = end - start
+        length = d[0] * d[0] + d[1] * d[1]
+        t = np.clip((points - start) @ d / length, 0, 1) if length else np.zeros(len(points))
+        distances = np.hypot(points[:, 0] - start[0] - t * d[0], points[:, 1] - start[1] - t * d[1])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            keep[first + 1 + farthest] = True
+            stack.append((first, first + 1 + farthest))
+            stack.append((first + 1 + farthest, last))
+    return np.nonzero(keep)[0]
+
+
+def clip_ring(ring, bbox):
+    """
+    clip a ring to a bounding box by Sutherland-Hodgman
+    https://en.wikipedia.org/wiki/Sutherland%E2%80%93Hodgman_algorithm
+    :param ring: numpy array, (n, 2) vertices
+    :param bbox: [min_x, min_y, max_x, max_y]
+    :return: numpy array, (m, 2) vertices of the clipped ring, empty if they do not intersect
+    """
+    # (axis, boundary, whether the inside is greater than the boundary) of each clipping edge
+    for axis, value, greater in ((0, bbox[0], True), (1, bbox[1], True), (0, bbox[2], False), (1, bbox[3], False)):
+        if not len(ring):
+            break
+        inside = ring[:, axis] >= value if greater else ring[:, axis] <= value
+        previous = np.roll(ring, 1, axis=0)
+        previous_inside = np.roll(inside, 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (value - previous[:, axis]) / (ring[:, axis] - previous[:, axis])
+            intersections = previous + t[:, None] * (ring - previous)
+        # every edge emits its intersection with the boundary if it crosses, then its end vertex if it is inside
+        emitted = np.column_stack([inside != previous_inside, inside])
+        ring = np.stack([intersections, ring], axis=1)[emitted]
+    return ring
+
+
+def polygon_area(ring):
+    """
+    calculate the area of a ring by the shoelace formula
+    :param ring: numpy array, (n, 2) vertices
+    :return: float, area in square degree
+    """
+    if len(ring) < 3:
+        return 0.0
+    x, y = ring[:, 0], ring[:, 1]
+    return abs(float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))) / 2
+
+
+class AreaStore:
+    def __init__(self, areas, coordinates, ring_offsets, polygon_offsets, area_offsets, bboxes=None, centroids=None,
+                 source_hash_=None):
+        """
+        A compact geometry store of SA2 areas, coordinates of all areas are in one flat buffer,
+        ring k is coordinates[ring_offsets[k]:ring_offsets[k + 1]],
+        polygon k is rings polygon_offsets[k] to polygon_offsets[k + 1],
+        area k is polygons area_offsets[k] to area_offsets[k + 1]
+        :param areas: list, Area records
+        :param coordinates: numpy array, float64 (n_vertices, 2)
+        :param ring_offsets: numpy array, int64 (n_rings + 1,)
+        :param polygon_offsets: numpy array, int64 (n_polygons + 1,)
+        :param area_offsets: numpy array, int64 (n_areas + 1,)
+        :param bboxes: numpy array, float64 (n_rings, 4), calculated if not given
+        :param centroids: numpy array, float64 (n_rings, 2), calculated if not given
+        :param source_hash_: str, hash of the source files, if known
+        """
+        self.areas = areas
+        self.coordinates = coordinates
+        self.ring_offsets = ring_offsets
+        self.polygon_offsets = polygon_offsets
+        self.area_offsets = area_offsets
+
+        self.state_names = sorted(set(area.state for area in areas))
+        self.area_state = np.asarray([self.state_names.index(area.state) for area in areas], dtype=np.int64)
+        # area index of each ring
+        rings_per_area = polygon_offsets[area_offsets[1:]] - polygon_offsets[area_offsets[:-1]]
+        self.ring_area = np.repeat(np.arange(len(areas)), rings_per_area)
+        self.ring_len = np.diff(ring_offsets)
+        starts = ring_offsets[:-1]
+        if bboxes is None:
+            # [min_x, min_y, max_x, max_y] of each ring
+            bboxes = np.column_stack([np.minimum.reduceat(coordinates[:, 0], starts),
+                                      np.minimum.reduceat(coordinates[:, 1], starts),
+                                      np.maximum.reduceat(coordinates[:, 0], starts),
+                                      np.maximum.reduceat(coordinates[:, 1], starts)])
+        self.bboxes = bboxes
+        if centroids is None:
+            # mean of the vertices of each ring
+            centroids = np.add.reduceat(coordinates, starts, axis=0) / self.ring_len[:, None]
+        self.centroids = centroids
+        self.source_hash = source_hash_
+
+        # record hit times of areas
+        self.hits = np.zeros(len(areas), dtype=np.int64)
+
+    @classmethod
+    def from_directory(cls, path):
+        """
+        build a store from the GeoJSON files of states
+        :param path: directory path, one GeoJSON file of a state
+        :return: AreaStore
+        """
+        areas, buffers = [], []
+        ring_offsets, polygon_offsets, area_offsets = [0], [0], [0]
+        for state_name, features in read_areas(path).items():
+            for feature in features:
+                if 'geometry' not in feature:
+                    continue
+                areas.append(Area(feature['properties']['feature_code'], feature['properties']['feature_name'],
+                                  state_name))
+                for polygon in feature['geometry']['coordinates']:
+                    for ring in polygon:
+                        buffers.append(np.asarray(ring, dtype=np.float64))
+                        ring_offsets.append(ring_offsets[-1] + len(ring))
+                    polygon_offsets.append(len(ring_offsets) - 1)
+                area_offsets.append(len(polygon_offsets) - 1)
+        return cls(areas, np.concatenate(buffers), np.asarray(ring_offsets, dtype=np.int64),
+                   np.asarray(polygon_offsets, dtype=np.int64), np.asarray(area_offsets, dtype=np.int64))
+
+    @classmethod
+    def load(cls, path):
+        """
+        map a compiled store read-only
+        :param path: artifact path
+        :return: AreaStore, None if it is not a valid artifact
+        """
+        artifact = read_artifact(path)
+        if artifact is None:
+            return None
+        header, arrays = artifact
+        return cls([Area(*area) for area in header['areas']], arrays['coordinates'], arrays['ring_offsets'],
+                   arrays['polygon_offsets'], arrays['area_offsets'], arrays['bboxes'], arrays['centroids'],
+                   header['source_hash'])
+
+    def save(self, path):
+        """
+        compile this store to a binary artifact
+        :param path: artifact path
+        """
+        write_artifact(path,
+                       {'source_hash': self.source_hash,
+                        'areas': [[area.code, area.name, area.state] for area in self.areas]},
+                       {'coordinates': self.coordinates,
+                        'ring_offsets': self.ring_offsets,
+                        'polygon_offsets': self.polygon_offsets,
+                        'area_offsets': self.area_offsets,
+                        'bboxes': self.bboxes,
+                        'centroids': self.centroids})
+
+    @classmethod
+    def compiled(cls, path, artifact_path, logger=None):
+        """
+        map the compiled store of the source files, it is compiled again only when the source files change
+        :param path: directory path, one GeoJSON file of a state
+        :param artifact_path: artifact path
+        :param logger: logger to report compiling
+        :return: AreaStore
+        """
+        hash_ = source_hash(path)
+        if os.path.isfile(artifact_path):
+            store = cls.load(artifact_path)
+            if store is not None and store.source_hash == hash_:
+                return store
+
+        store = cls.from_directory(path)
+        store.source_hash = hash_
+        try:
+            store.save(artifact_path)
+            if logger:
+                logger.info("[*] Compiled {} areas to {}".format(len(store), artifact_path))
+            return cls.load(artifact_path)
+        except OSError as e:
+            # e.g. read-only file system, use the store in memory
+            if logger:
+                logger.warning("[!] Cannot compile areas to {}: {}".format(artifact_path, e))
+            return store
+
+    def __len__(self):
+        return len(self.areas)
+
+    def with_coordinates(self, coordinates, ring_offsets):
+        """
+        :param coordinates: numpy array, float64 (n_vertices, 2)
+        :param ring_offsets: numpy array, int64 (n_rings + 1,)
+        :return: AreaStore, the same areas, polygons and rings with other coordinates, e.g. simplified ones,
+        bounding boxes and centroids are kept from this store
+        """
+        return AreaStore(self.areas, coordinates, ring_offsets, self.polygon_offsets, self.area_offsets,
+                         self.bboxes, self.centroids, self.source_hash)
+
+    def simplify(self, tolerance):
+        """
+        :param tolerance: float, simplifying tolerance in degree
+        :return: AreaStore, rings simplified by Douglas-Peucker
+        """
+        buffers = []
+        ring_offsets = [0]
+        for k in range(len(self.ring_len)):
+            ring = self.coordinates[self.ring_offsets[k]:self.ring_offsets[k + 1]]
+            buffers.append(ring[douglas_peucker(ring, tolerance)])
+            ring_offsets.append(ring_offsets[-1] + len(buffers[-1]))
+        return self.with_coordinates(np.concatenate(buffers), np.asarray(ring_offsets, dtype=np.int64))
+
+    def polygons(self, area_idx):
+        """
+        :param area_idx: int, area index
+        :return: list, GeoJSON MultiPolygon coordinates of this area
+        """
+        polygons = []
+        for polygon_idx in range(self.area_offsets[area_idx], self.area_offsets[area_idx + 1]):
+            polygons.append([self.coordinates[self.ring_offsets[k]:self.ring_offsets[k + 1]].tolist()
+                             for k in range(self.polygon_offsets[polygon_idx], self.polygon_offsets[polygon_idx + 1])])
+        return polygons
+
+    def edges(self):
+        """
+        an edge k joins vertex k and its previous vertex in the same ring,
+        the first vertex of a ring is joined with the last one
+        :return: (x0, y0, x1, y1) numpy arrays of all edges
+        """
+        previous = self.coordinates[self.previous(np.arange(len(self.coordinates)))]
+        return self.coordinates[:, 0], self.coordinates[:, 1], previous[:, 0], previous[:, 1]
+
+    def previous(self, vertex_idx, ring_idx=None):
+        """
+        :param vertex_idx: numpy array, vertex indexes
+        :param ring_idx: numpy array, ring index of each vertex, found by searching if not given
+        :return: numpy array, index of the previous vertex in the same ring
+        """
+        if ring_idx is None:
+            ring_idx = np.searchsorted(self.ring_offsets, vertex_idx, side='right') - 1
+        starts = self.ring_offsets[ring_idx]
+        return np.where(vertex_idx == starts, self.ring_offsets[ring_idx + 1] - 1, vertex_idx - 1)
+
+    def record_hits(self, area_idxs):
+        """
+        record hit times of the located areas
+        :param area_idxs: numpy array, area indexes, -1 is ignored
+        """
+        np.add.at(self.hits, area_idxs[area_idxs >= 0], 1)
+
+    def sort_areas(self, top=None):
+        """
+        rank areas by their hit times
+        :param top: int, number of areas to return, all if None
+        :return: list, [(feature code, hit times)]
+        """
+        ranked = np.argsort(-self.hits, kind='stable')[:top]
+        return [(self.areas[i].code, int(self.hits[i])) for i in ranked]
+
+    def state_hits(self):
+        """
+        :return: dict, state name -> hit times
+        """
+        hits = np.bincount(self.area_state, weights=self.hits, minlength=len(self.state_names))
+        return {state_name: int(hit) for state_name, hit in zip(self.state_names, hits)}
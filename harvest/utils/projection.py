@@ -0,0 +1,61 @@
+"""
+@author Team 42, Chengdu, China, Qifan Deng, 1077479
+"""
+
+
+class Projection:
+    def __init__(self, fields):
+        """
+        Keep only the listed fields of a doc.
+        A field is a dotted path, e.g. 'entities.urls.url', a path through a list applies to each of its items.
+        :param fields: list, dotted paths of the fields to keep
+        """
+        self.fields = fields
+        # nested dict of the kept paths, None marks a field kept as a whole
+        self.tree = {}
+        for field in fields:
+            node = self.tree
+            parts = field.split('.')
+            for part in parts[:-1]:
+                child = node.get(part, {})
+                if child is None:
+                    # the parent is already kept as a whole
+                    break
+                node = node.setdefault(part, child)
+            else:
+                node[parts[-1]] = None
+
+    def project(self, doc):
+        """
+        :param doc: dict, the doc
+        :return: dict, a new doc with the kept fields, missing fields are left out
+        """
+        return self.apply(self.tree, doc)
+
+    def apply(self, tree, value):
+        """
+        :param tree: dict, kept paths under value
+        :param value: dict or list of dicts
+        :return: projected value
+        """
+        if isinstance(value, list):
+            return [self.apply(tree, item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        projected = {}
+        for key, subtree in tree.items():
+            if key in value:
+                projected[key] = value[key] if subtree is None else self.apply(subtree, value[key])
+        return projected
+
+
+if __name__ == '__main__':
+    # testing code, a field kept as a whole wins over its sub fields
+    status = {'_id': 'a:1', 'full_text': 'hi #x', 'user': {'id_str': '2', 'description': 'long'},
+              'entities': {'hashtags': [{'text': 'x', 'indices': [3, 5]}], 'urls': [], 'user_mentions': []},
+              'retweeted_status': {'full_text': 'hi'}, 'place': None}
+    projection = Projection(['_id', 'full_text', 'entities.hashtags.text', 'entities.urls.url', 'place.full_name',
+                             'entities.hashtags'])
+    print(projection.project(status))
+    assert projection.project(status) == {'_id': 'a:1', 'full_text': 'hi #x', 'place': None,
+                                          'entities': {'hashtags': [{'text': 'x', 'indices': [3, 5]}], 'urls': []}}
@@ -0,0 +1,196 @@
+"""
+@author Team 42, Chengdu, China, Qifan Deng, 1077479
+"""
+import threading
+from math import ceil
+from time import sleep, time
+
+# rate limit window of the twitter api, in seconds
+# https://developer.twitter.com/en/docs/basics/rate-limits
+WINDOW = 15 * 60
+
+# endpoint name -> (resource family, resource path, requests per window with user auth)
+ENDPOINTS = {
+    'timeline': ('statuses', '/statuses/user_timeline', 900),
+    'lookup_statuses': ('statuses', '/statuses/lookup', 900),
+    'friends': ('friends', '/friends/ids', 15),
+    'followers': ('followers', '/followers/ids', 15),
+    'lookup_users': ('users', '/users/lookup', 900),
+    'rate_limit_status': ('application', '/application/rate_limit_status', 180),
+}
+
+
+class TokenBucket:
+    def __init__(self, limit, window=WINDOW):
+        """
+        Permits of an endpoint, the bucket is filled to the limit at each reset time of the window,
+        the same as the counter of the twitter api, rather than refilled gradually
+        :param limit: int, requests per window
+        :param window: float, seconds of a window
+        """
+        self.lock = threading.Lock()
+        self.limit = limit
+        self.window = window
+        self.tokens = limit
+        # the window is unknown until it is synced, a full bucket is assumed
+        self.reset = time() + window
+        self.acquired = 0
+        self.waited = 0.0
+
+    def refill(self, now):
+        """
+        fill the bucket if the reset time is passed, the caller holds the lock
+        :param now: float, current timestamp
+        """
+        if now >= self.reset:
+            self.reset += ceil((now - self.reset + 1e-9) / self.window) * self.window
+            self.tokens = self.limit
+
+    def try_acquire(self):
+        """
+        take a permit if one is left
+        :return: float, 0 if a permit is taken, otherwise seconds until the bucket is filled
+        """
+        with self.lock:
+            now = time()
+            self.refill(now)
+            if self.tokens > 0:
+                self.tokens -= 1
+                self.acquired += 1
+                return 0.0
+            return self.reset - now
+
+    def acquire(self, timeout=None):
+        """
+        block until a permit is taken, the lock is not held while waiting
+        :param timeout: float, max seconds to wait, None to wait until the reset time
+        :return: bool, whether a permit is taken
+        """
+        start = time()
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                with self.lock:
+                    self.waited += time() - start
+                return True
+            if timeout is not None:
+                remaining = start + timeout - time()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            # a little after the reset, as the clocks are not in sync
+            sleep(wait + 0.1)
+
+    def sync(self, limit, remaining, reset):
+        """
+        align the bucket with the counter reported by the twitter api
+        :param limit: int, requests per window
+        :param remaining: int, requests left in the current window
+        :param reset: int, timestamp when the window resets
+        """
+        with self.lock:
+            self.limit = limit
+            if reset > time():
+                # the reported count also includes requests of other processes using the same credential
+                self.tokens = min(self.tokens, remaining) if reset == self.reset else remaining
+                self.reset = reset
+
+    def exhaust(self, reset=None):
+        """
+        empty the bucket after a rate limit error
+        :param reset: int, timestamp when the window resets, None if unknown
+        """
+        with self.lock:
+            self.tokens = 0
+            if reset is not None and reset > time():
+                self.reset = reset
+
+    def remaining(self):
+        """
+        :return: int, permits left in the current window
+        """
+        with self.lock:
+            self.refill(time())
+            return self.tokens
+
+    def stats(self):
+        """
+        :return: dict, limit, permits left, seconds to the reset, permits taken and seconds waited in total
+        """
+        with self.lock:
+            now = time()
+            self.refill(now)
+            return {'limit': self.limit, 'remaining': self.tokens, 'reset_in': round(self.reset - now),
+                    'acquired': self.acquired, 'waited': round(self.waited, 1)}
+
+
+class RateLimiter:
+    def __init__(self, endpoints=None, window=WINDOW):
+        """
+        A token bucket of each twitter api endpoint, threads calling different endpoints never wait for each other,
+        and threads calling the same endpoint only wait when its budget of the window is used up
+        :param endpoints: dict, endpoint name -> (resource family, resource path, requests per window)
+        :param window: float, seconds of a window
+        """
+        self.endpoints = ENDPOINTS if endpoints is None else endpoints
+        self.buckets = {name: TokenBucket(limit, window) for name, (_, _, limit) in self.endpoints.items()}
+
+    def acquire(self, endpoint, timeout=None):
+        """
+        :param endpoint: str, endpoint name
+        :param timeout: float, max seconds to wait, None to wait until the reset time
+        :return: bool, whether a permit is taken
+        """
+        return self.buckets[endpoint].acquire(timeout)
+
+    def remaining(self, endpoint):
+        """
+        :param endpoint: str, endpoint name
+        :return: int, permits left in the current window
+        """
+        return self.buckets[endpoint].remaining()
+
+    def exhaust(self, endpoint, reset=None):
+        """
+        :param endpoint: str, endpoint name
+        :param reset: int, timestamp when the window resets, None if unknown
+        """
+        self.buckets[endpoint].exhaust(reset)
+
+    def sync(self, rate_limits):
+        """
+        align the buckets with the result of rate_limit_status
+        :param rate_limits: dict, the result of rate_limit_status
+        """
+        for name, (family, path, _) in self.endpoints.items():
+            status = rate_limits.get('resources', {}).get(family, {}).get(path)
+            if status is not None:
+                self.buckets[name].sync(status['limit'], status['remaining'], status['reset'])
+
+    def stats(self):
+        """
+        :return: dict, endpoint name -> bucket stats
+        """
+        return {name: bucket.stats() for name, bucket in self.buckets.items()}
+
+
+if __name__ == '__main__':
+    # testing code, 20 threads share a budget of 30 permits per 2 seconds window
+    limiter = RateLimiter({'timeline': ('statuses', '/statuses/user_timeline', 30)}, window=2)
+    limiter.sync({'resources': {'statuses': {'/statuses/user_timeline': {'limit': 30, 'remaining': 10,
+                                                                         'reset': int(time()) + 1}}}})
+    times = []
+
+    def call():
+        for _ in range(5):
+            limiter.acquire('timeline')
+            times.append(time())
+
+    begin = time()
+    threads = [threading.Thread(target=call) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 10 permits left in the first window, then 30 in each window
+    print("100 permits in {:.1f} seconds, {}".format(time() - begin, limiter.stats()))
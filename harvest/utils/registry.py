@@ -670,7 +670,6 @@ class Registry:
         if hard or (self.friends_tasks.empty() and self.generating_friends.acquire(
                 blocking=False) and time() - self.generating_friends_time > 5):
             try:
-                self.client.connect()
                 count = 0
                 result = self.client['users'].get_view_result('_design/tasks', view_name='friends',
                                                               limit=self.config.max_tasks_num, reduce=False).all()
@@ -694,7 +693,6 @@ class Registry:
         if hard or (self.timeline_tasks.qsize() < count and self.generating_timeline.acquire(blocking=False)
                     and time() - self.generating_timeline_time > 2):
             try:
-                self.client.connect()
                 result = self.client['users'].get_view_result('_design/tasks', view_name='timeline',
                                                               limit=self.config.max_tasks_num, reduce=False).all()
 
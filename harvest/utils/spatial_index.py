@@ -0,0 +1,102 @@
+"""
+@author Team 42, Chengdu, China, Qifan Deng, 1077479
+"""
+import numpy as np
+
+
+class STRTree:
+    def __init__(self, bboxes, node_capacity=16):
+        """
+        A R-tree bulk loaded by Sort-Tile-Recursive packing
+        https://ieeexplore.ieee.org/document/582015
+        :param bboxes: array like, [[min_x, min_y, max_x, max_y]] of the items to index
+        :param node_capacity: int, max number of children of a node
+        """
+        self.node_capacity = node_capacity
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        self.size = len(bboxes)
+        # levels[0] is the leaves, levels[-1] is the root
+        # each level is (bboxes, child start, child count), children are in the level below
+        self.levels = []
+        # item index of each leaf entry
+        self.items = self.pack(np.arange(self.size), bboxes)
+        entries = bboxes[self.items]
+        self.levels.append((entries, None, None))
+        while len(entries) > 1:
+            starts = np.arange(0, len(entries), node_capacity)
+            counts = np.minimum(node_capacity, len(entries) - starts)
+            parents = np.column_stack([np.minimum.reduceat(entries[:, 0], starts),
+                                       np.minimum.reduceat(entries[:, 1], starts),
+                                       np.maximum.reduceat(entries[:, 2], starts),
+                                       np.maximum.reduceat(entries[:, 3], starts)])
+            self.levels.append((parents, starts, counts))
+            entries = parents
+
+    def pack(self, idxs, bboxes):
+        """
+        order the items so that every run of node_capacity items is a tile
+        :param idxs: numpy array, item indexes
+        :param bboxes: numpy array, bounding boxes of all items
+        :return: numpy array, ordered item indexes
+        """
+        if not len(idxs):
+            return idxs
+        centres = (bboxes[idxs, :2] + bboxes[idxs, 2:]) / 2
+        leaves = int(np.ceil(len(idxs) / self.node_capacity))
+        slice_size = int(np.ceil(np.sqrt(leaves))) * self.node_capacity
+        by_x = idxs[np.argsort(centres[:, 0], kind='stable')]
+        ordered = []
+        for start in range(0, len(by_x), slice_size):
+            tile = by_x[start:start + slice_size]
+            tile_centres = (bboxes[tile, 1] + bboxes[tile, 3]) / 2
+            ordered.append(tile[np.argsort(tile_centres, kind='stable')])
+        return np.concatenate(ordered)
+
+    def query_bboxes(self, bboxes):
+        """
+        find the items whose bounding box intersects the query boxes
+        :param bboxes: array like, [[min_x, min_y, max_x, max_y]] query boxes
+        :return: (query indexes, item indexes), sorted by query then item
+        """
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        if not self.size or not len(bboxes):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        # frontier of (query, node) pairs, starts from the root
+        query_idx = np.arange(len(bboxes))
+        node_idx = np.zeros(len(bboxes), dtype=np.int64)
+        for level in range(len(self.levels) - 1, -1, -1):
+            entries, starts, counts = self.levels[level]
+            hit = (bboxes[query_idx, 0] <= entries[node_idx, 2]) & (bboxes[query_idx, 2] >= entries[node_idx, 0]) \
+                & (bboxes[query_idx, 1] <= entries[node_idx, 3]) & (bboxes[query_idx, 3] >= entries[node_idx, 1])
+            query_idx, node_idx = query_idx[hit], node_idx[hit]
+            if level and len(query_idx):
+                # expand the hit nodes to their children
+                child_counts = counts[node_idx]
+                ends = np.cumsum(child_counts)
+                node_idx = np.arange(ends[-1]) - np.repeat(ends - child_counts, child_counts) \
+                    + np.repeat(starts[node_idx], child_counts)
+                query_idx = np.repeat(query_idx, child_counts)
+
+        item_idx = self.items[node_idx]
+        order = np.lexsort((item_idx, query_idx))
+        return query_idx[order], item_idx[order]
+
+    def query_points(self, xs, ys):
+        """
+        find the items whose bounding box contains the points
+        :param xs: array like, longitudes
+        :param ys: array like, latitudes
+        :return: (point indexes, item indexes), sorted by point then item
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        return self.query_bboxes(np.column_stack([xs, ys, xs, ys]))
+
+    def query_point(self, x, y):
+        """
+        find the items whose bounding box contains a point
+        :param x: float, longitude
+        :param y: float, latitude
+        :return: numpy array, item indexes
+        """
+        return self.query_points([x], [y])[1]
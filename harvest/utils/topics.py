@@ -0,0 +1,102 @@
+"""
+@author Team 42, Chengdu, China, Qifan Deng, 1077479
+"""
+import re
+
+from collections import deque
+
+# words of a text, the same as /\w+/g of the views
+WORD = re.compile(r'\w+', re.ASCII)
+
+# topic -> words, a tweet is tagged with a topic if a word of its text, lowercased, is one of them,
+# the order is the order of the counts emitted by the sports-exercise views of statuses
+TOPICS = {
+    'cricket': ["cricket", "batsman", "bowler", "t20", "odi", "mcg", "scg", "bbl", "bigbash"],
+    'tennis': ["tennis", "australianopen", "nadal", "djokovic", "federer", "kyrgios", "barty", "atp", "williams"],
+    'footy': ["afl", "footy", "aussierules", "collingwoodfc", "richmond_fc", "sydneyswans"],
+    'motorsport': ["ferrari", "vettel", "lewis", "prix", "ricciardo", "formula1", "f1", "ausgp", "motogp",
+                   "motorsport"],
+    'soccer': ["fifa", "aleague", "soccer", "liverpool", "messi", "ronaldo", "epl", "mufc", "ffa", "melcity",
+               "melbournevictory"],
+    'exercise': ["exercise", "workout", "gym", "yoga", "jogging", "aerobics", "cardio"],
+}
+
+
+class AhoCorasick:
+    def __init__(self, words):
+        """
+        An Aho-Corasick automaton, finds all words contained in a text in one pass over the text
+        https://en.wikipedia.org/wiki/Aho%E2%80%93Corasick_algorithm
+        :param words: list, words to find
+        """
+        # transitions, failure link and indexes of the words ending at each state, 0 is the root
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [()]
+        for word_idx, word in enumerate(words):
+            state = 0
+            for ch in word:
+                if ch not in self.goto[state]:
+                    self.goto[state][ch] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append(())
+                state = self.goto[state][ch]
+            self.outputs[state] += (word_idx,)
+
+        # breadth first, the failure link of a state is the longest proper suffix that is also a prefix,
+        # states of depth 1 fail to the root
+        states = deque(self.goto[0].values())
+        while states:
+            state = states.popleft()
+            for ch, child in self.goto[state].items():
+                states.append(child)
+                fail = self.fail[state]
+                while fail and ch not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[child] = self.goto[fail].get(ch, 0)
+                self.outputs[child] += self.outputs[self.fail[child]]
+
+    def search(self, text):
+        """
+        :param text: str, text to search
+        :return: set, indexes of the words contained in the text
+        """
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+
+class TopicTagger:
+    def __init__(self, topics=None):
+        """
+        Tag tweets with topics, all topic words are compiled to one automaton.
+        Whole words are matched regardless of case, the words of a text are lowercased and joined by spaces,
+        and the topic words are searched with a space on each side.
+        :param topics: dict, topic -> words in lower case, TOPICS if not given
+        """
+        self.topics = TOPICS if topics is None else topics
+        self.word_topics = []
+        words = []
+        for topic, topic_words in self.topics.items():
+            words.extend(" {} ".format(word) for word in topic_words)
+            self.word_topics.extend([topic] * len(topic_words))
+        self.automaton = AhoCorasick(words)
+
+    def tag(self, text):
+        """
+        :param text: str, tweet text
+        :return: dict, topic -> number of its words the text contains, only topics found
+        """
+        topics = {}
+        for word_idx in self.automaton.search(" {} ".format(" ".join(WORD.findall(text.lower())))):
+            topic = self.word_topics[word_idx]
+            topics[topic] = topics.get(topic, 0) + 1
+        return topics
@@ -7,17 +7,22 @@ import json
 import queue
 import traceback
 import os
-import nltk
-import re
 
-from math import ceil
 from time import sleep, time
 from collections import defaultdict
 from utils.config import Config
 from utils.database import CouchDB
+from utils.async_database import AsyncCouchDB
 from utils.crawlers import Crawler
+from utils.bloom import SeenIds
+from utils.bulk_writer import BulkWriter, BulkUpdater
+from utils.durable_queue import DurableQueue, Checkpoint
+from utils.enrichment import Enricher, EnrichmentPool
+from utils.geocoder import create_geocoder, CachedGeocoder, PlaceGeocoder
+from utils.geometry import AreaStore
+from utils.projection import Projection
+from utils.topics import WORD
 from utils.logger import get_logger
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
 
 
 class Task:
@@ -114,9 +119,23 @@ class Worker:
         self.pid = None
         self.couch = CouchDB(log_level)
         self.client = self.couch.client
-        self.areas_collection = self.preprocess_areas()
-
-        self.stream_res_queue = queue.Queue(maxsize=self.config.max_queue_size)
+        self.areas = AreaStore.compiled(self.config.aus_sa2_2016_lv12_path, self.config.aus_sa2_2016_lv12_artifact_path,
+                                        self.logger)
+        self.geocoder = create_geocoder(self.config, self.areas, self.logger)
+        self.place_geocoder = None
+        if self.config.geocoding_places:
+            self.place_geocoder = PlaceGeocoder(self.areas, self.config.geocoding_place_max_size,
+                                                self.config.geocoding_place_cache_capacity)
+        self.enricher = Enricher(self.geocoder, self.place_geocoder, self.config.sentiment_cache_capacity,
+                                 self.config.nltk_data_path)
+        # started in run before any thread, if enabled
+        self.enrichment_pool = None
+        # fields of the stored statuses, all of them are stored if none is configured
+        self.status_projection = Projection(self.config.status_fields) if self.config.status_fields else None
+
+        # stream statuses, statuses and users are kept on disk until they are saved,
+        # so bursts and database outages are absorbed and they are replayed after a restart
+        self.stream_res_queue = self.create_durable_queue('stream_statuses')
         self.msg_received = queue.Queue(maxsize=self.config.max_queue_size)
         self.msg_to_send = queue.Queue(maxsize=self.config.max_queue_size)
         self.crawler = Crawler(log_level)
@@ -132,15 +151,87 @@ class Worker:
         self.running_timeline = RunningTask()
         self.running_friends = RunningTask()
 
-        self.users_queue = queue.Queue(maxsize=self.config.max_queue_size)
-        self.statuses_queue = queue.Queue(maxsize=self.config.max_queue_size)
+        self.users_queue = self.create_durable_queue('users')
+        self.statuses_queue = self.create_durable_queue('statuses')
+
+        # ids of the docs known to be in the database, they are not looked up again
+        self.seen_ids_path = os.path.expanduser(self.config.seen_ids_path)
+        self.seen_ids = None
+        if self.config.seen_ids_capacity > 0:
+            self.seen_ids = SeenIds.load(self.seen_ids_path, self.config.seen_ids_capacity,
+                                         self.config.seen_ids_error_rate)
 
-        self.statuses_bulk = []
-        self.users_bulk = []
+        # created in run once the databases are checked
+        self.async_couch = None
+        self.statuses_writer = None
+        self.users_writer = None
+        self.users_updater = None
 
         self.timeline_tasks = queue.Queue()
         self.friends_tasks = queue.Queue()
 
+    def create_durable_queue(self, name):
+        """
+        :param name: str, queue name, also the name of its directory
+        :return: DurableQueue, the configured durable queue
+        """
+        return DurableQueue(os.path.join(os.path.expanduser(self.config.durable_queue_path), name),
+                            self.config.durable_queue_segment_size, self.config.durable_queue_fsync_interval,
+                            self.config.durable_queue_max_bytes, self.logger)
+
+    def create_bulk_writer(self, db_name):
+        """
+        :param db_name: database name
+        :return: BulkWriter, the configured bulk writer of the database
+        """
+        return BulkWriter(self.async_couch, db_name, self.logger, self.config.bulk_size, self.config.bulk_max_size,
+                          self.config.bulk_max_latency, self.config.bulk_target_latency,
+                          self.config.bulk_max_in_flight, self.config.bulk_max_pending,
+                          self.config.max_network_err, self.config.network_err_reconnect_time, self.exit,
+                          self.record_seen)
+
+    def record_seen(self, docs):
+        """
+        remember the ids of the docs written to the database
+        :param docs: list, docs
+        """
+        if self.seen_ids is not None:
+            self.seen_ids.add(doc['_id'] for doc in docs)
+
+    def seen_ids_saver(self):
+        """
+        a thread saves the seen ids frequently, so they survive restarts
+        """
+        while True:
+            sleep(self.config.seen_ids_save_interval)
+            try:
+                self.seen_ids.save(self.seen_ids_path)
+            except OSError as e:
+                self.logger.warning("[!] Save seen ids err: {}".format(e))
+
+    def seed_seen_ids(self):
+        """
+        a thread adds the ids of the docs already in the database to the seen ids, page by page by _all_docs
+        """
+        page_size = self.config.seen_ids_seed_page_size
+        for db_name in ['statuses', 'users']:
+            startkey = None
+            count = 0
+            while True:
+                try:
+                    rows = self.async_couch.run(self.async_couch.all_docs(db_name, startkey=startkey,
+                                                                          limit=page_size + 1))['rows']
+                except Exception:
+                    self.logger.warning("[!] Seed seen ids err: {}".format(traceback.format_exc()))
+                    return
+                # the extra row is the start of the next page
+                startkey = rows[-1]['id'] if len(rows) > page_size else None
+                self.seen_ids.add(row['id'] for row in rows[:page_size] if not row['id'].startswith('_design/'))
+                count += len(rows[:page_size])
+                if startkey is None:
+                    break
+            self.logger.info("[*] Seeded {} seen ids from {}".format(count, db_name))
+
     def get_registry(self):
         """
         get master info from database
@@ -244,8 +335,6 @@ class Worker:
 
             self.msg_to_send.put(msg_json_str)
             sleep(5)
-            # clear local cache
-            self.client.clear()
             to_sleep -= 5
             if to_sleep < 0:
                 to_sleep = self.config.max_heartbeat_lost_time
@@ -339,49 +428,20 @@ class Worker:
 
     def refresh_local_rate_limit(self):
         """
-        refresh local rate limit cache
+        get the permits left of the endpoints from the limiter of the crawler,
+        its buckets are filled at the reset times and synced when the rate limit status is updated
+        :return: dict, endpoint name -> permits left in the current window
         """
         rate_limit = defaultdict(int)
-        self.lock_rate_limit.acquire()
-        now_timestamp = int(time())
-
         # https://developer.twitter.com/en/docs/accounts-and-users/follow-search-get-users/api-reference/get-friends-ids
         # Requests / 15-min window (user auth)	15
-        reset = self.crawler.rate_limits['resources']['friends']['/friends/ids']['reset']
-        if now_timestamp - reset > 900:
-            self.crawler.rate_limits['resources']['friends']['/friends/ids']['reset'] += ceil(
-                (now_timestamp - reset) / 900) * 900
-            remaining = self.crawler.rate_limits['resources']['friends']['/friends/ids']['limit']
-            self.crawler.rate_limits['resources']['friends']['/friends/ids']['remaining'] = remaining
-        else:
-            remaining = self.crawler.rate_limits['resources']['friends']['/friends/ids']['remaining']
-        rate_limit['friends'] = remaining
-
+        rate_limit['friends'] = self.crawler.limiter.remaining('friends')
         # https://developer.twitter.com/en/docs/accounts-and-users/follow-search-get-users/api-reference/get-followers-ids
         # Requests / 15-min window (user auth)	15
-        reset = self.crawler.rate_limits['resources']['followers']['/followers/ids']['reset']
-        if now_timestamp - reset > 900:
-            self.crawler.rate_limits['resources']['followers']['/followers/ids']['reset'] += ceil(
-                (now_timestamp - reset) / 900) * 900
-            remaining = self.crawler.rate_limits['resources']['followers']['/followers/ids']['limit']
-            self.crawler.rate_limits['resources']['followers']['/followers/ids']['remaining'] = remaining
-        else:
-            remaining = self.crawler.rate_limits['resources']['followers']['/followers/ids']['remaining']
-        rate_limit['followers'] = remaining
-
+        rate_limit['followers'] = self.crawler.limiter.remaining('followers')
         # https://developer.twitter.com/en/docs/tweets/timelines/api-reference/get-statuses-user_timeline
         # Requests / 15-min window (user auth)	900
-        reset = self.crawler.rate_limits['resources']['statuses']['/statuses/user_timeline']['reset']
-        if now_timestamp - reset > 900:
-            self.crawler.rate_limits['resources']['statuses']['/statuses/user_timeline']['reset'] += ceil(
-                (now_timestamp - reset) / 900) * 900
-            remaining = self.crawler.rate_limits['resources']['statuses']['/statuses/user_timeline']['limit']
-            self.crawler.rate_limits['resources']['statuses']['/statuses/user_timeline']['remaining'] = remaining
-        else:
-            remaining = self.crawler.rate_limits['resources']['statuses']['/statuses/user_timeline']['remaining']
-        self.lock_rate_limit.release()
-
-        rate_limit['timeline'] = remaining
+        rate_limit['timeline'] = self.crawler.limiter.remaining('timeline')
         return rate_limit
 
     def stream(self, count=0):
@@ -410,7 +470,6 @@ class Worker:
             (user_id, is_stream_user) = self.timeline_tasks.get()
             self.running_timeline.inc()
             self.active.set(True)
-            doc = self.client['users'][user_id]
             try:
                 self.logger.debug("[{}-{}] is getting user timeline:{}(stream:{}), "
                                   "running timeline task num: {}".format(self.worker_id,
@@ -423,10 +482,10 @@ class Worker:
                 statuses = self.crawler.get_user_timeline(real_user_id)
 
                 for status in statuses:
-                    self.statuses_queue.put((status, 2 if is_stream_user else 0))
+                    self.statuses_queue.put([status._json, 2 if is_stream_user else 0])
 
-                doc.update_field(action=doc.field_set, field='timeline_authorized', value=True)
-                doc.update_field(action=doc.field_set, field='timeline_updated_at', value=int(time()))
+                # applied with the updates of other users by one bulk read and one bulk write
+                self.users_updater.update(user_id, {'timeline_authorized': True, 'timeline_updated_at': int(time())})
                 self.logger.debug("[{}-{}] finished user timeline:{}(stream:{}), "
                                   "running timeline task num: {}".format(self.worker_id,
                                                                          thread_num,
@@ -437,10 +496,9 @@ class Worker:
 
             except Exception as e:
                 self.running_timeline.dec()
-                self.crawler.update_rate_limit_status()
+                # rate limit errors are handled by the limiter of the crawler, no need to poll the status
 
-                doc.update_field(action=doc.field_set, field='timeline_authorized', value=False)
-                doc.update_field(action=doc.field_set, field='timeline_updated_at', value=int(time()))
+                self.users_updater.update(user_id, {'timeline_authorized': False, 'timeline_updated_at': int(time())})
                 self.logger.warning("{}, rate limits:{}".format(e, json.dumps(self.refresh_local_rate_limit())))
                 self.logger.debug("[{}-{}] Exciption! user timeline:{}(stream:{}), "
                                   "current task : {}".format(self.worker_id, thread_num, user_id, is_stream_user,
@@ -475,12 +533,11 @@ class Worker:
                     if user_json["geo_enabled"] and not user_json['protected']:
                         self.users_queue.put(user_json)
 
-                doc = self.client['users'][stream_user_id]
-                doc.update_field(action=doc.field_set, field='follower_ids', value=list(follower_ids_set))
-                doc.update_field(action=doc.field_set, field='friend_ids', value=list(friend_ids_set))
-                doc.update_field(action=doc.field_set, field='mutual_follow_ids', value=list(mutual_follow))
-                doc.update_field(action=doc.field_set, field='friends_updated_at', value=int(time()))
-                doc.update_field(action=doc.field_set, field='friends_authorized', value=True)
+                self.users_updater.update(stream_user_id, {'follower_ids': list(follower_ids_set),
+                                                           'friend_ids': list(friend_ids_set),
+                                                           'mutual_follow_ids': list(mutual_follow),
+                                                           'friends_updated_at': int(time()),
+                                                           'friends_authorized': True})
                 self.logger.debug(
                     "[{}-{}] finished friends: {}, current task:{}".format(self.worker_id, thread_num, stream_user_id,
                                                                            self.running_friends.get_count()))
@@ -488,10 +545,8 @@ class Worker:
 
             except Exception as e:
                 self.running_friends.dec()
-                self.crawler.update_rate_limit_status()
-                doc = self.client['users'][stream_user_id]
-                doc.update_field(action=doc.field_set, field='friends_updated_at', value=int(time()))
-                doc.update_field(action=doc.field_set, field='friends_authorized', value=False)
+                self.users_updater.update(stream_user_id, {'friends_updated_at': int(time()),
+                                                           'friends_authorized': False})
                 self.logger.warning("{}, rate limits:{}".format(e, json.dumps(self.refresh_local_rate_limit())))
                 self.logger.debug(
                     "[{}-{}] Exception! running friends: {}, current task:{}".format(self.worker_id, thread_num,
@@ -557,152 +612,137 @@ class Worker:
     def stream_status_handler(self):
         """
         get stream status from a the stream status queue
-        and put it to statuses queue
+        and put its author to users queue, a stream status only brings its author
         """
+        # the stream statuses are committed once their authors are flushed to the users queue
+        checkpoint = Checkpoint(self.stream_res_queue)
         while True:
-            status = self.stream_res_queue.get()
-            # 1 means this is a stream status
-            self.statuses_queue.put((status, 1))
-            del status
-
-    @staticmethod
-    def read_areas(path):
-        """
-        read areas from file
-        :param path: file path
-        :return: the areas details
-        """
-        areas_collection = {}
-        filenames = os.listdir(path)
-        for filename in filenames:
-            abs_path = os.path.join(path, filename)
-            if os.path.isfile(abs_path):
-                with open(abs_path) as f:
-                    areas_f = json.loads(f.read())
-                    areas = areas_f['features']
-                    f.close()
-                    state_name = filename[:filename.find('.')]
-                    areas_collection[state_name] = areas
-        return areas_collection
+            for status_json in self.drain_queue(self.stream_res_queue, self.config.record_batch_size,
+                                                self.config.record_idle_timeout):
+                user_json = status_json['user']
+                user_json['stream_user'] = True
+                self.users_queue.put(user_json)
+                checkpoint.hold(self.users_queue.put_count)
+            checkpoint.release(self.users_queue.flushed_count)
 
-    @staticmethod
-    def calc_bbox_of_polygon(polygon):
+    def retrieve_statuses_areas(self, status_json):
         """
-        calculate the bounding box of a polygon
-        :param polygon: polygon
-        :return: bounding box
+        find the area where a tweet is located
+        :param status_json: tweet json that does not have area information
+        :return: tweet json that updated its area information
         """
-        min_x, min_y, max_x, max_y = polygon[0][0], polygon[0][1], polygon[0][0], polygon[0][1]
-        for (x, y) in polygon:
-            if x < min_x:
-                min_x = x
-            elif x > max_x:
-                max_x = x
+        return self.retrieve_statuses_areas_batch([status_json])[0]
 
-            if y < min_y:
-                min_y = y
-            elif y > max_y:
-                max_y = y
-        return [min_x, min_y, max_x, max_y]
+    def retrieve_statuses_areas_batch(self, statuses):
+        """
+        find the areas where a batch of tweets are located
+        :param statuses: list, tweet jsons that do not have area information
+        :return: list, tweet jsons that updated their area information
+        """
+        docs = [self.init_area(status_json) for status_json in statuses]
+        del statuses
+        for doc, (area_idx, by_place) in zip(docs, self.enricher.locate(docs)):
+            self.set_area(doc, area_idx, by_place)
+        return docs
 
-    @staticmethod
-    def calc_bbox_of_state(areas):
+    def enrich_statuses_batch(self, statuses):
         """
-        calculate bounding box of a state
-        :param areas: list, [coordinates]
-        :return: bounding box of this state
+        locate a batch of tweets, score their sentiment and tag their topics in the enrichment pool,
+        or only locate them if the pool is not enabled, then they are scored and tagged when saved
+        :param statuses: list, tweet jsons that do not have area information
+        :return: list, tweet jsons that updated their area information
         """
-        bboxes = []
-        for area in areas:
-            for bbox in area['bboxes']:
-                bboxes.append(bbox)
+        if self.enrichment_pool is None:
+            return self.retrieve_statuses_areas_batch(statuses)
 
-        min_x, min_y, max_x, max_y = bboxes[0][0], bboxes[0][1], bboxes[0][2], bboxes[0][3]
-        for (p0, p1, p2, p3) in bboxes:
-            if p0 < min_x:
-                min_x = p0
-            if p2 > max_x:
-                max_x = p2
-            if p1 < min_y:
-                min_y = p1
-            if p3 > max_y:
-                max_y = p3
+        docs = [self.init_area(status_json) for status_json in statuses]
+        del statuses
+        enriched = self.enrichment_pool.enrich(docs)
+        for doc, (area_idx, by_place, sent_scores, topics) in zip(docs, enriched):
+            self.set_area(doc, area_idx, by_place)
+            doc['sentiment'] = sent_scores['sentiment']
+            doc['sentiment_scores'] = sent_scores
+            doc['topics'] = topics
+        return docs
 
-        return [min_x, min_y, max_x, max_y]
+    @staticmethod
+    def normalize_retweets(statuses, is_stream_codes):
+        """
+        split the retweets of a batch into their originals, stored once like other statuses,
+        and retweet records, which keep their own time, location and author, see link_retweets for the rest
+        :param statuses: list, tweet jsons
+        :param is_stream_codes: list, int of each tweet, see save_statuses
+        :return: (list, list, list, list) tweets and originals, their codes, retweet records, their codes,
+        the code of an original is 3 as its author is not harvested
+        """
+        normalized = []
+        normalized_codes = []
+        retweets = []
+        retweet_codes = []
+        known = {status_json['id_str'] for status_json in statuses if 'retweeted_status' not in status_json}
+        for status_json, is_stream_code in zip(statuses, is_stream_codes):
+            original = status_json.get('retweeted_status')
+            if original is None:
+                normalized.append(status_json)
+                normalized_codes.append(is_stream_code)
+                continue
+            if original['id_str'] not in known:
+                # the original is not posted by the timeline's user
+                known.add(original['id_str'])
+                normalized.append(original)
+                normalized_codes.append(3)
+            retweets.append({'id_str': status_json['id_str'],
+                             'created_at': status_json['created_at'],
+                             'lang': status_json.get('lang'),
+                             'coordinates': status_json['coordinates'],
+                             'place': status_json.get('place'),
+                             'user': {'id_str': status_json['user']['id_str']},
+                             'retweeted_status_id_str': original['id_str']})
+            retweet_codes.append(is_stream_code)
+        return normalized, normalized_codes, retweets, retweet_codes
+
+    def link_retweets(self, retweets, docs):
+        """
+        refer the retweet records to the doc ids of their originals, which depend on where the originals are,
+        and copy only what the views count of the originals, so a retweet is still counted in the area of
+        the retweeter, while the text is stored and scored once with its original.
+        The words are the distinct lower case words of the text counted by the keyword view
+        :param retweets: list, located retweet records
+        :param docs: list, located tweets including the originals
+        :return: list, retweet records
+        """
+        originals = {doc['id_str']: doc for doc in docs}
+        for retweet in retweets:
+            original = originals[retweet.pop('retweeted_status_id_str')]
+            self.score_status(original)
+            retweet['retweeted_status_id'] = original['_id']
+            retweet['sentiment'] = original['sentiment']
+            retweet['topics'] = original['topics']
+            retweet['entities'] = {'hashtags': [{'text': hashtag['text']}
+                                                for hashtag in original['entities'].get('hashtags', [])]}
+            retweet['words'] = sorted({word.lower() for word in WORD.findall(original['full_text'])})
+        return retweets
+
+    def score_status(self, status_json):
+        """
+        score the sentiment and tag the topics of a tweet, unless they are done in the enrichment pool
+        :param status_json: tweet json
+        """
+        if 'sentiment' not in status_json:
+            sent_scores = self.enricher.sentiment.score(status_json['full_text'])
+            status_json['sentiment'] = sent_scores['sentiment']
+            status_json['sentiment_scores'] = sent_scores
+        # topic word counts, views emit them rather than scan the text
+        if 'topics' not in status_json:
+            status_json['topics'] = self.enricher.topics.tag(status_json['full_text'])
 
-    def preprocess_areas(self):
-        """
-        preprocess the are to boost Ray Casting algorithm.
-        :return: processed result
+    @staticmethod
+    def init_area(doc):
         """
-        new_sa2_2016 = self.read_areas(self.config.aus_sa2_2016_lv12_path)
-
-        states = [{"hit": 0, "state_name": None, "bbox": [], "areas": []} for _ in range(len(new_sa2_2016))]
-        # calc bbox for each area and store it in its state
-        count = 0
-        for key, areas in new_sa2_2016.items():
-            states[count]["state_name"] = key
-            area_id = 0
-            for area in areas:
-                if 'geometry' in area:
-                    states[count]["areas"].append({'hit': 0,
-                                                   "feature_code": area['properties']["feature_code"],
-                                                   'feature_name': area['properties']['feature_name'],
-                                                   'coordinates': area['geometry']['coordinates'],
-                                                   'bboxes': []})
-                    for i, polygons in enumerate(area['geometry']['coordinates']):
-                        for j, polygon in enumerate(polygons):
-                            states[count]["areas"][area_id]["bboxes"].append(
-                                self.calc_bbox_of_polygon(polygon))
-                    area_id += 1
-                # use the left value to record its hit times
-            count += 1
-
-        for key, v in enumerate(states):
-            states[key]["bbox"] = self.calc_bbox_of_state(v['areas'])
-
-        return states
-
-    def sort_areas(self, state_idx, area_idx):
-        """
-        sort areas by the hit times
-        :param state_idx: int, state index
-        :param area_idx: int, area index
-        """
-        # manipulate the rank of areas to allow iterator find the location faster
-        self.areas_collection[state_idx]['areas'][area_idx]['hit'] += 1
-        source_idx = area_idx
-        while area_idx and \
-                self.areas_collection[state_idx]['areas'][area_idx - 1]['hit'] < \
-                self.areas_collection[state_idx]['areas'][source_idx]['hit']:
-            area_idx -= 1
-        # switch
-        if source_idx != area_idx:
-            tmp = self.areas_collection[state_idx]['areas'][area_idx]
-            self.areas_collection[state_idx]['areas'][area_idx] = self.areas_collection[state_idx]['areas'][source_idx]
-            self.areas_collection[state_idx]['areas'][source_idx] = tmp
-
-        self.areas_collection[state_idx]['hit'] += 1
-        source_idx = state_idx
-        while state_idx and \
-                self.areas_collection[state_idx - 1]['hit'] < \
-                self.areas_collection[source_idx]['hit']:
-            state_idx -= 1
-        # switch
-        if source_idx != state_idx:
-            tmp = self.areas_collection[state_idx]
-            self.areas_collection[state_idx] = self.areas_collection[source_idx]
-            self.areas_collection[source_idx] = tmp
-
-    def retrieve_statuses_areas(self, status):
+        fill the default area information of a tweet before it is located
+        :param doc: tweet json
+        :return: tweet json
         """
-        find the area where a tweet is located
-        :param status: status that does not have area information
-        :return: status that updated its area information
-        """
-        # https://stackoverflow.com/questions/217578
-        doc = status._json
-        del status
         doc['_id'] = "australia:" + doc["id_str"]
         doc['sa2_2016_lv12_code'] = 'australia'
         doc['sa2_2016_lv12_name'] = 'In Australia BBox But No Specific Location'
@@ -710,90 +750,32 @@ class Worker:
             doc['_id'] = "out_of_australia:" + doc["id_str"]
             doc['sa2_2016_lv12_code'] = 'out_of_australia'
             doc['sa2_2016_lv12_name'] = 'Out of Australia'
-            point_x, point_y = doc['coordinates']['coordinates']
-
-            for i in range(len(self.areas_collection)):
-                # state
-                if point_x < self.areas_collection[i]['bbox'][0] \
-                        or point_y < self.areas_collection[i]['bbox'][1] \
-                        or point_x > self.areas_collection[i]['bbox'][2] \
-                        or point_y > self.areas_collection[i]['bbox'][3]:
-                    continue
-                for j in range(len(self.areas_collection[i]['areas'])):
-                    # areas
-                    is_inside = False
-                    for k in range(len(self.areas_collection[i]['areas'][j]["coordinates"])):
-                        # polygons
-                        for m in range(len(self.areas_collection[i]['areas'][j]["coordinates"][k])):
-                            # coordinates of one polygon
-                            min_x, min_y, max_x, max_y = self.areas_collection[i]['areas'][j]["bboxes"][k]
-                            if point_x < min_x or point_y < min_y or point_x > max_x or point_y > max_y:
-                                continue
-                            w = - 1
-                            n = 0
-                            length = len(self.areas_collection[i]['areas'][j]["coordinates"][k][m])
-                            while n < length:
-                                if (self.areas_collection[i]['areas'][j]["coordinates"][k][m][n][1] > point_y) \
-                                        != (self.areas_collection[i]['areas'][j]["coordinates"][k][m][w][1] > point_y) \
-                                        and point_x < \
-                                        (self.areas_collection[i]['areas'][j]["coordinates"][k][m][w][0] -
-                                         self.areas_collection[i]['areas'][j]["coordinates"][k][m][n][0]) * \
-                                        (point_y - self.areas_collection[i]['areas'][j]["coordinates"][k][m][n][1]) / \
-                                        (self.areas_collection[i]['areas'][j]["coordinates"][k][m][w][1] -
-                                         self.areas_collection[i]['areas'][j]["coordinates"][k][m][n][1]) \
-                                        + self.areas_collection[i]['areas'][j]["coordinates"][k][m][n][0]:
-                                    is_inside = not is_inside
-                                n += 1
-                                w += 1
-                    if is_inside:
-                        doc['sa2_2016_lv12_code'] = self.areas_collection[i]['areas'][j]['feature_code']
-                        doc['sa2_2016_lv12_name'] = self.areas_collection[i]['areas'][j]['feature_name']
-                        doc['sa2_2016_lv12_state'] = self.areas_collection[i]['state_name']
-                        doc['_id'] = doc['sa2_2016_lv12_code'] + doc['_id'][doc['_id'].find(':'):]
-                        self.sort_areas(i, j)
-                        return doc
-
         return doc
 
-    @staticmethod
-    def clean_tweet(tweet):
-        """
-        clean a tweet content before run sentiment segmentation on it
-        :param tweet: tweet object
-        :return: cleaned tweet content
-        """
-        # remove urls and other non english characters
-        return ' '.join(re.sub("(@[A-Za-z0-9]+)|([^0-9A-Za-z \t]) |(\w+:\/\/\S+)", " ", tweet).split())
-
-    def generate_sentiment(self, text):
+    def set_area(self, doc, area_idx, by_place):
         """
-        run sentiment segmentation on a text
-        :param text: a text string
-        :return: sentiment scores
+        fill the area information of a located tweet
+        :param doc: tweet json
+        :param area_idx: int, area index, -1 if it is not located
+        :param by_place: bool, whether it is located by its place
         """
-        tweet_text = self.clean_tweet(text)
-        sia = SentimentIntensityAnalyzer()
-        sent_scores = sia.polarity_scores(tweet_text)
-        if sent_scores['compound'] > 0:
-            sent_scores['sentiment'] = "positive"
-        elif sent_scores['compound'] < 0:
-            sent_scores['sentiment'] = "negative"
-        else:
-            sent_scores['sentiment'] = "neutral"
-        return sent_scores
+        if area_idx < 0:
+            return
+        area = self.areas.areas[area_idx]
+        doc['sa2_2016_lv12_code'] = area.code
+        doc['sa2_2016_lv12_name'] = area.name
+        doc['sa2_2016_lv12_state'] = area.state
+        doc['_id'] = area.code + doc['_id'][doc['_id'].find(':'):]
+        if by_place:
+            doc['sa2_2016_lv12_by_place'] = True
 
-    def save_user(self, user_json, err_count=0):
+    def save_users(self, users_json):
         """
-        save a user to database
-        :param user_json: user json
-        :param err_count: err count, this fun is recursive called if failed
-        when this count greater that a value, exit the worker
-        :return: the saved users count
+        save a batch of users to database, whether they exist is resolved by one request for the batch
+        :param users_json: list, user jsons
+        :return: the saved users count, new users are counted once queued to the bulk writer
         """
-        if err_count > self.config.max_network_err:
-            self.exit("[{}] save user err {} times, exit".format(self.worker_id, self.config.max_network_err))
-            return 0
-        try:
+        for user_json in users_json:
             # https://developer.twitter.com/en/docs/basics/twitter-ids
             if 'id' in user_json:
                 del user_json['id']
@@ -804,116 +786,109 @@ class Worker:
             else:
                 user_json['_id'] = "{}:{}".format('not_stream', user_json['id_str'])
 
-            if user_json['_id'] not in self.client['users']:
+        user_ids = {user_json['_id'] for user_json in users_json}
+        if self.seen_ids is not None:
+            # users known to be in db are dropped before any request
+            user_ids = self.seen_ids.unseen(user_ids)
+        missing = self.async_couch.run(self.async_couch.missing_ids('users', user_ids))
+        if self.seen_ids is not None:
+            self.seen_ids.add(user_ids - missing)
+        new_users = []
+        stream_user_ids = []
+        for user_json in users_json:
+            if user_json['_id'] in missing:
                 # if user dose not exist in db
                 user_json['timeline_updated_at'] = 0
                 user_json['inserted_time'] = int(time())
-                self.users_bulk.append(user_json)
-                if len(self.users_bulk) >= self.config.bulk_size:
-                    self.client['users'].bulk_docs(self.users_bulk)
-                    self.users_bulk = []
-                    return 10
-                # logger.debug("[{}] put in to bulk user: {}".format(self.worker_id, user_json['id_str']))
-                return 0
-            else:
-                # if user exists in db
-                if user_json['stream_user']:
-                    # and is stream user, check existed doc
-                    doc = self.client['users'][user_json['_id']]
-                    if not doc['stream_user']:
-                        # if exist doc is not stream user
-                        doc.update_field(
-                            action=doc.field_set,
-                            field='friends_updated_at',
-                            value=0
-                        )
-                    # logger.debug("[{}] marked user as stream user: {}(stream:{})".format(self.worker_id,
-                    #                                                                      user_json['id_str'],
-                    #                                                                      user_json['stream_user']))
-                    return 1
-                else:
-                    # logger.debug("[{}] saved user: {}(stream:{})".format(self.worker_id, user_json['id_str'],
-                    #                                                      user_json['stream_user']))
-                    return 0
-        except Exception as e:
-            # prevent proxy err (mainly for Qifan's proxy against GFW)
-            # https://stackoverflow.com/questions/4990718/
-            self.logger.error("[!] Save user err: {}".format(traceback.format_exc()))
-            sleep(self.config.network_err_reconnect_time)
-            return self.save_user(user_json=user_json, err_count=err_count + 1)
-
-    def save_status(self, status, is_stream_code, err_count=0):
-        """
-        :param status: a tweet
-        :param is_stream_code: int,
+                new_users.append(user_json)
+            elif user_json['stream_user'] and user_json['_id'] in user_ids:
+                stream_user_ids.append(user_json['_id'])
+        if stream_user_ids:
+            # if users exist in db and are stream users, check existed docs
+            rows = self.async_couch.run(self.async_couch.all_docs('users', keys=stream_user_ids,
+                                                                  include_docs=True))['rows']
+            for row in rows:
+                if row.get('doc') is not None and not row['doc']['stream_user']:
+                    # if exist doc is not stream user
+                    self.users_updater.update(row['key'], {'friends_updated_at': 0})
+        # users waiting in the writer are skipped
+        return len(stream_user_ids) + self.users_writer.add(new_users)
+
+    def save_statuses(self, statuses_json, is_stream_codes):
+        """
+        save a batch of statuses to database, whether they exist is resolved by one request for the batch,
+        and the missing ones are queued to the bulk writer
+        :param statuses_json: list, tweet jsons that have been located by retrieve_statuses_areas_batch
+        :param is_stream_codes: list, int of each tweet,
         0 indicates thi is not a stream tweet, 1 indicates this is,
-        2 indicates this tweet is from a stream user's timeline but not a stream status
-        :param err_count: rr count, this fun is recursive called if failed
-          when this count greater that a value, exit the worker
-        :return: the saved statuses count
-        """
-        if err_count > self.config.max_network_err:
-            self.exit("[{}] save status err {} times, exit: {}({})".format(self.worker_id,
-                                                                           status.id,
-                                                                           is_stream_code,
-                                                                           self.config.max_network_err))
-            return False
+        2 indicates this tweet is from a stream user's timeline but not a stream status,
+        3 indicates this is the original of a retweet, whose author is not in the users db
+        :return: the saved statuses count, new statuses are counted once queued to the bulk writer
+        """
         # use id_str
         # The string representation of the unique identifier for this Tweet.
         # Implementations should use this rather than the large integer in id
         # https://developer.twitter.com/en/docs/tweets/data-dictionary/overview/tweet-object
         # https://developer.twitter.com/en/docs/basics/twitter-ids
-        try:
-            if is_stream_code == 1:
-                user_json = status.author._json
-                user_json['stream_user'] = True
-                self.users_queue.put(user_json)
-                return 0
-
-            status_json = self.retrieve_statuses_areas(status)
-
-            if self.config.ignore_statuses_out_of_australia \
-                    and status_json['sa2_2016_lv12_code'] in {'australia', 'out_of_australia'}:
-                return 0
-
-            if status_json['_id'] not in self.client['statuses']:
-                if is_stream_code == 0:
-                    status_json['stream_status'] = False
-                elif is_stream_code == 1:
-                    status_json['stream_status'] = True
-                    status_json['direct_stream'] = True
-                elif is_stream_code == 2:
-                    status_json['stream_status'] = True
-                    status_json['direct_stream'] = False
-                else:
-                    return 0
-
-                status_json['inserted_time'] = int(time())
-                if 'id' in status_json:
-                    del status_json['id']
-
-                # sentiment
-
-                sent_scores = self.generate_sentiment(status_json['full_text'])
-                status_json['sentiment'] = sent_scores['sentiment']
-                status_json['sentiment_scores'] = sent_scores
-                self.statuses_bulk.append(status_json)
-                if len(self.statuses_bulk) >= self.config.bulk_size:
-                    self.client['statuses'].bulk_docs(self.statuses_bulk)
-                    self.statuses_bulk = []
-                    return self.config.bulk_size
-                # logger.debug("[{}] put in to bulk statuses: {}(stream:{})".format( self.worker_id,  status.id, is_stream_code))
-
-                return 0
+        if self.config.ignore_statuses_out_of_australia:
+            located = [(status_json, is_stream_code)
+                       for status_json, is_stream_code in zip(statuses_json, is_stream_codes)
+                       if status_json['sa2_2016_lv12_code'] not in {'australia', 'out_of_australia'}]
+            # an original out of australia is not stored, its located retweets take its text instead
+            docs = {status_json['_id']: status_json for status_json in statuses_json}
+            located_ids = {status_json['_id'] for status_json, _ in located}
+            for status_json, _ in located:
+                original_id = status_json.get('retweeted_status_id')
+                if original_id is not None and original_id not in located_ids:
+                    del status_json['retweeted_status_id'], status_json['words']
+                    status_json['full_text'] = docs[original_id]['full_text']
+                    status_json['entities'] = docs[original_id]['entities']
+        else:
+            located = list(zip(statuses_json, is_stream_codes))
+
+        status_ids = {status_json['_id'] for status_json, _ in located}
+        if self.seen_ids is not None:
+            # statuses known to be in db are dropped before any request
+            status_ids = self.seen_ids.unseen(status_ids)
+        missing = self.async_couch.run(self.async_couch.missing_ids('statuses', status_ids))
+        if self.seen_ids is not None:
+            self.seen_ids.add(status_ids - missing)
+        new_statuses = []
+        for status_json, is_stream_code in located:
+            if status_json['_id'] not in missing:
+                continue
+            if is_stream_code == 0:
+                status_json['stream_status'] = False
+            elif is_stream_code == 1:
+                status_json['stream_status'] = True
+                status_json['direct_stream'] = True
+            elif is_stream_code == 2:
+                status_json['stream_status'] = True
+                status_json['direct_stream'] = False
+            elif is_stream_code == 3:
+                status_json['stream_status'] = False
             else:
-                # logger.debug("[{}] ignored status: {}(stream:{})".format(self.worker_id, status.id, is_stream_code))
-                return 0
-        except Exception as e:
-            # prevent proxy err (mainly for Qifan's proxy against GFW)
-            # https://stackoverflow.com/questions/4990718/
-            self.logger.warning("[!] Save status err: {}".format(traceback.format_exc()))
-            sleep(self.config.network_err_reconnect_time)
-            return self.save_status(status=status, is_stream_code=is_stream_code, err_count=err_count + 1)
+                continue
+
+            status_json['inserted_time'] = int(time())
+            if 'id' in status_json:
+                del status_json['id']
+            if is_stream_code == 3:
+                # the author of an original is not harvested, so it is embedded with its names only
+                status_json['user'] = {key: status_json['user'].get(key) for key in ('id_str', 'screen_name', 'name')}
+            else:
+                # the author is referred by its doc id in the users db rather than embedded
+                status_json['user_id'] = "{}:{}".format('stream' if is_stream_code else 'not_stream',
+                                                        status_json.pop('user')['id_str'])
+
+            # a retweet record is scored by its original in link_retweets
+            self.score_status(status_json)
+            if self.status_projection is not None:
+                # only the fields read by the views and the app are stored
+                status_json = self.status_projection.project(status_json)
+            new_statuses.append(status_json)
+        # statuses waiting in the writer are skipped, blocks while the writer is full
+        return self.statuses_writer.add(new_statuses)
 
     def check_db(self):
         """
@@ -927,45 +902,144 @@ class Worker:
             self.client.create_database('users')
             self.logger.debug("[*] Users db is not in database; Created.")
 
+    @staticmethod
+    def drain_queue(queue_, max_size, timeout=None):
+        """
+        block until an item is available, then take the items that are already in the queue
+        :param queue_: queue.Queue or DurableQueue, the queue to drain
+        :param max_size: int, max number of items to take
+        :param timeout: float, max seconds to wait for the first item, None to wait forever
+        :return: list, items, empty if none is available before the timeout
+        """
+        try:
+            items = [queue_.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(items) < max_size:
+            try:
+                items.append(queue_.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def save_until_done(self, save, name, *args):
+        """
+        call a save function until it succeeds, the items of the batch stay in the durable queue meanwhile,
+        exit after max_network_err errors in a row, then the batch is replayed after the worker restarts
+        :param save: function, save_users or save_statuses
+        :param name: str, what is saved, for the logs
+        :param args: arguments of the save function
+        :return: its result
+        """
+        for err_count in range(self.config.max_network_err + 1):
+            try:
+                return save(*args)
+            except Exception:
+                # prevent proxy err (mainly for Qifan's proxy against GFW)
+                # https://stackoverflow.com/questions/4990718/
+                self.logger.warning("[!] Save {} err: {}".format(name, traceback.format_exc()))
+                sleep(self.config.network_err_reconnect_time)
+        self.exit("[{}] save {} err {} times, exit".format(self.worker_id, name, self.config.max_network_err + 1))
+
     def users_recorder(self):
         """
-        a thread get users profile from the users queue, and call save_user to save it
+        a thread get users profile from the users queue, and call save_users to save them by batches,
+        the queue is committed once the new users are written
         """
         count = 0
         prev = 0
+        checkpoint = Checkpoint(self.users_queue)
         while True:
-            user_json = self.users_queue.get()
-            count += self.save_user(user_json=user_json)
-            if prev != count and count % (self.config.print_log_when_saved * 10) == 0:
+            users_json = self.drain_queue(self.users_queue, self.config.record_batch_size,
+                                          self.config.record_idle_timeout)
+            if users_json:
+                count += self.save_until_done(self.save_users, 'users', users_json)
+                checkpoint.hold(self.users_writer.added)
+            checkpoint.release(self.users_writer.watermark())
+            if count - prev >= self.config.print_log_when_saved * 10:
                 self.logger.info("Saved {} new users in total".format(count))
+                self.logger.debug("Users writer: {}, updater: {}, queue backlog: {}".format(
+                    self.users_writer.stats(), self.users_updater.stats(), self.users_queue.backlog()))
                 prev = count
-            del user_json
+            del users_json
 
     def statuses_recorder(self):
         """
-         a thread get status from the status queue, and call save_status to save it
+         a thread get status from the status queue, and call save_statuses to save them by batches,
+         the queue is committed once the new statuses are written
             """
         count = 0
         prev = 0
+        checkpoint = Checkpoint(self.statuses_queue)
         while True:
-            (status, is_stream_code) = self.statuses_queue.get()
-            count += self.save_status(status=status, is_stream_code=is_stream_code)
-            if prev != count and count % self.config.print_log_when_saved == 0:
+            statuses = []
+            is_stream_codes = []
+            for (status_json, is_stream_code) in self.drain_queue(self.statuses_queue,
+                                                                  self.config.geocoding_batch_size,
+                                                                  self.config.record_idle_timeout):
+                statuses.append(status_json)
+                is_stream_codes.append(is_stream_code)
+
+            if statuses:
+                retweets = []
+                retweet_codes = []
+                if self.config.normalize_retweets:
+                    statuses, is_stream_codes, retweets, retweet_codes = self.normalize_retweets(statuses,
+                                                                                                 is_stream_codes)
+                docs = self.enrich_statuses_batch(statuses)
+                if retweets:
+                    docs += self.link_retweets(self.retrieve_statuses_areas_batch(retweets), docs)
+                    is_stream_codes += retweet_codes
+                count += self.save_until_done(self.save_statuses, 'statuses', docs, is_stream_codes)
+                checkpoint.hold(self.statuses_writer.added)
+            checkpoint.release(self.statuses_writer.watermark())
+            if count - prev >= self.config.print_log_when_saved:
                 self.logger.info("Saved {} new statuses in total".format(count))
+                if isinstance(self.geocoder, CachedGeocoder):
+                    self.logger.debug("Geocoding cache: {}".format(self.geocoder.cache.stats()))
+                if self.place_geocoder is not None:
+                    self.logger.debug("Place cache: {}".format(self.place_geocoder.cache.stats()))
+                if self.enricher.sentiment.cache is not None:
+                    self.logger.debug("Sentiment cache: {}".format(self.enricher.sentiment.cache.stats()))
+                self.logger.debug("Statuses writer: {}, queue backlog: {}".format(self.statuses_writer.stats(),
+                                                                                 self.statuses_queue.backlog()))
+                self.logger.debug("CouchDB pool: {}".format(self.client.stats()))
+                if self.seen_ids is not None:
+                    self.logger.debug("Seen ids: {}".format(self.seen_ids.stats()))
+                self.logger.debug("Top hit areas: {}, states: {}".format(self.areas.sort_areas(5),
+                                                                         self.areas.state_hits()))
                 prev = count
-            del status
-            del is_stream_code
+            del statuses
+            del is_stream_codes
 
     def run(self):
         """
         runt a worker
         """
-        try:
-            nltk.download('vader_lexicon')
-        except:
-            pass
+        if self.config.enrichment_pool_size > 0:
+            # fork before any thread is started
+            self.enrichment_pool = EnrichmentPool(self.log_level, self.config.enrichment_pool_size, self.enricher,
+                                                  self.areas, self.config.enrichment_timeout, self.logger)
+            self.logger.info("[*] Started {} enrichment processes".format(self.config.enrichment_pool_size))
 
+        # flushers write the queued items to disk
+        for durable_queue in [self.stream_res_queue, self.statuses_queue, self.users_queue]:
+            durable_queue.start()
         self.check_db()
+        # statuses and users are saved over the async client
+        self.async_couch = AsyncCouchDB(self.config.couch, self.config.couch_max_connections, self.config.couch_timeout)
+        self.statuses_writer = self.create_bulk_writer('statuses')
+        self.statuses_writer.start()
+        self.users_writer = self.create_bulk_writer('users')
+        self.users_writer.start()
+        self.users_updater = BulkUpdater(self.async_couch, 'users', self.logger, self.config.user_updates_max_size,
+                                         self.config.user_updates_max_latency, self.config.max_network_err,
+                                         self.config.network_err_reconnect_time)
+        self.users_updater.start()
+        if self.seen_ids is not None:
+            threading.Thread(target=self.seen_ids_saver, daemon=True).start()
+            if self.config.seen_ids_seed:
+                threading.Thread(target=self.seed_seen_ids, daemon=True).start()
         # start a stream listener, statuses will be put in to a res queue
         threading.Thread(target=self.msg_receiver).start()
         threading.Thread(target=self.msg_received_handler).start()
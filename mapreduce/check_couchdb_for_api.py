@@ -12,6 +12,7 @@ from tqdm import tqdm
 from utils.database import CouchDB
 from utils.logger import get_logger
 from utils.aurin import save_aurin_data
+from utils.geometry import AreaStore
 
 logger = get_logger('AreasUpdater', logging.DEBUG)
 
@@ -51,103 +52,28 @@ def read_view_from_file(path):
     return View(map_func, reduce_func)
 
 
-def calc_bbox_of_polygon(polygon):
-    min_x, min_y, max_x, max_y = polygon[0][0], polygon[0][1], polygon[0][0], polygon[0][1]
-    for (x, y) in polygon:
-        if x < min_x:
-            min_x = x
-        elif x > max_x:
-            max_x = x
-
-        if y < min_y:
-            min_y = y
-        elif y > max_y:
-            max_y = y
-    return [min_x, min_y, max_x, max_y]
-
-
-def read_areas(path):
-    areas_collection = {}
-    filenames = os.listdir(path)
-    for filename in filenames:
-        abs_path = os.path.join(path, filename)
-        if os.path.isfile(abs_path):
-            with open(abs_path) as f:
-                areas_f = json.loads(f.read())
-                areas = areas_f['features']
-                f.close()
-                state_name = filename[:filename.find('.')]
-                areas_collection[state_name] = areas
-    return areas_collection
-
-
-def preprocess(data_path):
-    new_sa2_2016 = read_areas(data_path)
-
-    states = [{"hit": 0, "state_name": None, "areas": []} for _ in range(len(new_sa2_2016))]
-    # calc bbox for each area and store it in its state
-    count = 0
-    for key, areas in new_sa2_2016.items():
-        states[count]["state_name"] = key
-        area_id = 0
-        for area in areas:
-            if 'geometry' in area:
-                states[count]["areas"].append(area)
-                area_id += 1
-            # use the left value to record its hit times
-        count += 1
-
-    return states
-
-
-def calc_bbox_of_polygon(polygon):
-    min_x, min_y, max_x, max_y = polygon[0][0], polygon[0][1], polygon[0][0], polygon[0][1]
-    for (x, y) in polygon:
-        if x < min_x:
-            min_x = x
-        elif x > max_x:
-            max_x = x
-
-        if y < min_y:
-            min_y = y
-        elif y > max_y:
-            max_y = y
-    return [min_x, min_y, max_x, max_y]
-
-
-def centroid(polygon):
-    x_sum, y_sum = 0, 0
-    for coordinates in polygon:
-        x_sum += coordinates[0]
-        y_sum += coordinates[1]
-    return round(x_sum / len(polygon), 5), round(y_sum / len(polygon), 5)
-
-
 def update_areas():
     areas_json = []
     bulk = []
     if "areas" in couch.client.all_dbs():
         couch.client["areas"].delete()
     if "areas" not in couch.client.all_dbs():
-        states = preprocess("data/SA2(2016)Level12")
-        for state in states:
-            del state['hit']
-            for area in state['areas']:
-                area["bboxes"] = []
-                area["centroids"] = []
-                for i, polygons in enumerate(area['geometry']['coordinates']):
-                    area["bboxes"].append([])
-                    area["centroids"].append([])
-                    for j, polygon in enumerate(polygons):
-                        area["bboxes"][i].append([])
-                        area["centroids"][i].append([])
-                        bbox = calc_bbox_of_polygon(polygon)
-                        area["bboxes"][i][j].append(bbox)
-                        area["centroids"][i][j].append(centroid(polygon))
-
-                area['properties']['state_name'] = state['state_name']
-                area['properties']['centroid'] = area["centroids"][0][0][0]
-                areas_json.append(area)
+        store = AreaStore.compiled("data/SA2(2016)Level12", "data/SA2(2016)Level12.store", logger)
+        for area_idx, area in enumerate(store.areas):
+            area_json = {"type": "Feature",
+                         "properties": {"feature_code": area.code,
+                                        "feature_name": area.name,
+                                        "state_name": area.state},
+                         "geometry": {"type": "MultiPolygon", "coordinates": store.polygons(area_idx)},
+                         "bboxes": [],
+                         "centroids": []}
+            for polygon_idx in range(store.area_offsets[area_idx], store.area_offsets[area_idx + 1]):
+                rings = range(store.polygon_offsets[polygon_idx], store.polygon_offsets[polygon_idx + 1])
+                area_json["bboxes"].append([[store.bboxes[k].tolist()] for k in rings])
+                area_json["centroids"].append([[[round(v, 5) for v in store.centroids[k].tolist()]] for k in rings])
+
+            area_json['properties']['centroid'] = area_json["centroids"][0][0][0]
+            areas_json.append(area_json)
 
         couch.client.create_database("areas", partitioned=False)
         no_where = {"_id": "australia",
@@ -2,15 +2,21 @@
 @author Team 42, Melbourne, Mandeep Singh, 991857
 @author Team 42, Chengdu, China, Qifan Deng, 1077479
 """
+import json
 import logging
+import os
+import queue
+import threading
+import traceback
 from tqdm import tqdm
 from utils.config import Config
 from utils.database import CouchDB
 from utils.models import SemanticAnalysis
-from utils.sentiment_model import *
+from utils.sentiment_model import bulk_engine
 from utils.logger import get_logger
 
 logger = get_logger('Analysis', logging.DEBUG)
+config = Config()
 couch_db = CouchDB()
 statuses_db = couch_db.client['statuses']
 
@@ -25,40 +31,151 @@ def save_to_db(ml_res):
     pass
 
 
-def get_unprocessed_statuses(limit=None):
+def get_unprocessed_pages(page_size, cursor=None):
     """
-    :return: list res: the result of the Machine Learning tasks which means unprocessed by ML
+    page the ML unprocessed statuses by start key, so a page costs the same however far it is,
+    and statuses that leave the view when they are processed do not shift the following pages
+    :param page_size: int, number of rows of a page
+    :param cursor: [start key, start doc id] of the first page, from the beginning if None
+    :return: generator of (rows, cursor of the next page or None if it is the last page)
     """
-    # Create a couch_db instance; it will try connecting automatically
+    while True:
+        kwargs = {'reduce': False, 'limit': page_size + 1}
+        if cursor is not None:
+            kwargs['startkey'], kwargs['startkey_docid'] = cursor
+        rows = statuses_db.get_view_result('_design/task', view_name='ml', raw_result=True, **kwargs)['rows']
+        # the extra row is the start of the next page
+        cursor = [rows[-1]['key'], rows[-1]['id']] if len(rows) > page_size else None
+        yield rows[:page_size], cursor
+        if cursor is None:
+            return
 
-    res = []
-    # Get ML unprocessed statuses
-    if 'statuses' in couch_db.client.all_dbs():
-        if limit is not None:
-            result = statuses_db.get_view_result('_design/task', view_name='ml', limit=limit, reduce=False).all()
-        else:
-            result = statuses_db.get_view_result('_design/task', view_name='ml', reduce=False).all()
-        res = result
-    logger.info("Got {} statuses".format(len(res)))
-    return res
 
+def get_docs(ids):
+    """
+    get docs in one request
+    :param ids: list, doc ids
+    :return: list, docs that exist
+    """
+    res = statuses_db.all_docs(keys=ids, include_docs=True)
+    return [row['doc'] for row in res['rows'] if row.get('doc')]
+
+
+def load_checkpoint(path):
+    """
+    :param path: checkpoint path
+    :return: [start key, start doc id] of the first unsaved page, None if there is no checkpoint
+    """
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.loads(f.read())['cursor']
 
-if __name__ == '__main__':
 
-    # get unprocessed statuses
-    sent_tasks = get_unprocessed_statuses()
-
-    # predict statuses
-    bulk = []
-    for doc in tqdm(sent_tasks):
-        scores = generate_sentiment(doc['key'][1])
-        real_doc = statuses_db[doc['id']]
-        real_doc['sentiment'] = scores['sentiment']
-        real_doc['sentiment_scores'] = scores
-        bulk.append(real_doc)
-        if len(bulk) > 100:
-            statuses_db.bulk_docs(bulk)
-            bulk = []
-
-    if len(bulk):
-        statuses_db.bulk_docs(bulk)
+def save_checkpoint(path, cursor):
+    """
+    save the cursor of the first unsaved page, all pages before it have been saved
+    :param path: checkpoint path
+    :param cursor: [start key, start doc id], None if all pages have been saved
+    """
+    if cursor is None:
+        if os.path.isfile(path):
+            os.remove(path)
+        return
+    tmp_path = "{}.tmp".format(path)
+    with open(tmp_path, 'w') as f:
+        f.write(json.dumps({'cursor': cursor}))
+    os.replace(tmp_path, path)
+
+
+def writer(bulk_queue, saved_queue):
+    """
+    a thread saves scored pages
+    :param bulk_queue: queue of (page number, docs), None to stop
+    :param saved_queue: queue of (page number, number of saved docs or None if the page failed)
+    """
+    while True:
+        item = bulk_queue.get()
+        if item is None:
+            return
+        page, docs = item
+        try:
+            res = statuses_db.bulk_docs(docs)
+        except Exception:
+            # the checkpoint stops before this page, it is scored again when resumed
+            logger.error("Page {} not saved: {}".format(page, traceback.format_exc()))
+            saved_queue.put((page, None))
+            continue
+        # e.g. conflicts if a doc is updated after it is got, it is left in the view for the next run
+        errors = [row for row in res if 'error' in row]
+        if errors:
+            logger.warning("Page {}: {} docs not saved, e.g. {}".format(page, len(errors), errors[0]))
+        saved_queue.put((page, len(docs) - len(errors)))
+
+
+def fix_sentiments(page_size, writers, checkpoint_path):
+    """
+    score ML unprocessed statuses page by page, pages are saved by concurrent writers,
+    a checkpoint is kept so a crashed run resumes from the first unsaved page
+    :param page_size: int, number of statuses of a page
+    :param writers: int, number of writer threads
+    :param checkpoint_path: checkpoint path
+    """
+    cursor = load_checkpoint(checkpoint_path)
+    if cursor is not None:
+        logger.info("Resume from {}".format(cursor))
+
+    # bounded, so pages are not read faster than they are saved
+    bulk_queue = queue.Queue(maxsize=writers)
+    saved_queue = queue.Queue()
+    threads = [threading.Thread(target=writer, args=(bulk_queue, saved_queue)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+
+    # cursor of the page after each page, and pages saved but not checkpointed yet
+    next_cursors = {}
+    saved = set()
+    checkpointed = 0
+    count = 0
+
+    def checkpoint(block):
+        nonlocal checkpointed, count
+        while True:
+            try:
+                page, saved_count = saved_queue.get(block=block)
+            except queue.Empty:
+                return
+            if saved_count is not None:
+                saved.add(page)
+                count += saved_count
+            # only a page whose previous pages are all saved can be checkpointed
+            while checkpointed in saved:
+                saved.remove(checkpointed)
+                save_checkpoint(checkpoint_path, next_cursors.pop(checkpointed))
+                checkpointed += 1
+            if block:
+                return
+
+    pages = get_unprocessed_pages(page_size, cursor)
+    for page, (rows, next_cursor) in enumerate(tqdm(pages, desc="Pages")):
+        next_cursors[page] = next_cursor
+        texts = {row['id']: row['key'][1] for row in rows}
+        docs = get_docs(list(texts))
+        for doc, scores in zip(docs, bulk_engine.score_batch([texts[doc['_id']] for doc in docs])):
+            doc['sentiment'] = scores['sentiment']
+            doc['sentiment_scores'] = scores
+        bulk_queue.put((page, docs))
+        checkpoint(block=False)
+
+    for _ in threads:
+        bulk_queue.put(None)
+    for thread in threads:
+        thread.join()
+    checkpoint(block=False)
+    logger.info("Saved {} statuses".format(count))
+
+
+if __name__ == '__main__':
+    fix_sentiments(config.fix_sentiments_page_size, config.fix_sentiments_writers,
+                   config.fix_sentiments_checkpoint_path)
+    logger.info("Sentiment cache: {}".format(bulk_engine.cache.stats() if bulk_engine.cache is not None else None))
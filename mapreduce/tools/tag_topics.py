@@ -0,0 +1,58 @@
+"""
+@author Team 42, Chengdu, China, Qifan Deng, 1077479
+"""
+import argparse
+import logging
+from tqdm import tqdm
+from utils.database import CouchDB
+from utils.topics import TopicTagger
+from utils.logger import get_logger
+
+logger = get_logger('Topics', logging.DEBUG)
+couch_db = CouchDB()
+statuses_db = couch_db.client['statuses']
+
+
+def get_pages(page_size):
+    """
+    page all statuses by start key
+    :param page_size: int, number of docs of a page
+    :return: generator of docs of each page
+    """
+    startkey = None
+    while True:
+        kwargs = {'include_docs': True, 'limit': page_size + 1}
+        if startkey is not None:
+            kwargs['startkey'] = startkey
+        rows = statuses_db.all_docs(**kwargs)['rows']
+        # the extra row is the start of the next page
+        startkey = rows[-1]['id'] if len(rows) > page_size else None
+        yield [row['doc'] for row in rows[:page_size] if row.get('doc')]
+        if startkey is None:
+            return
+
+
+if __name__ == '__main__':
+    # tag the statuses saved before topics are tagged at ingest
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--retag", action='store_true',
+                        help="tag the tagged statuses again, e.g. after the topic words or the matching change")
+    args = parser.parse_args()
+    tagger = TopicTagger()
+    count = 0
+    for docs in tqdm(get_pages(1000), desc="Pages"):
+        bulk = []
+        for doc in docs:
+            if doc['_id'].startswith('_design/') or 'full_text' not in doc:
+                continue
+            if 'topics' in doc and not args.retag:
+                continue
+            topics = tagger.tag(doc['full_text'])
+            if doc.get('topics') == topics:
+                continue
+            doc['topics'] = topics
+            bulk.append(doc)
+        if bulk:
+            statuses_db.bulk_docs(bulk)
+            count += len(bulk)
+    logger.info("Tagged {} statuses".format(count))
@@ -0,0 +1,339 @@
+"""
+@author Team 42, Chengdu, China, Qifan Deng, 1077479
+"""
+import math
+import string
+import numpy as np
+from utils.sentiment import SentimentEngine
+
+
+def shift(a, k, fill):
+    """
+    shift the columns of a matrix, row i of the result at column j is a[i, j - k]
+    :param a: numpy array, (rows, cols)
+    :param k: int, positive to get the preceding columns, negative to get the following columns, 0 to get a itself
+    :param fill: value of the columns shifted in
+    :return: numpy array, (rows, cols)
+    """
+    if k == 0:
+        return a
+    res = np.full_like(a, fill)
+    if k > 0:
+        res[:, k:] = a[:, :-k]
+    else:
+        res[:, :k] = a[:, -k:]
+    return res
+
+
+class BulkSentimentEngine(SentimentEngine):
+    # max number of texts scored at once
+    chunk_size = 2048
+
+    def __init__(self, cache_capacity=0, nltk_data_path=None, nltk_download=False):
+        """
+        A VADER compatible scorer for backfilling and re-scoring, a batch of texts is tokenized once,
+        tokens are mapped to lexicon valences through a vocabulary index, then the VADER rules
+        (caps, boosters, negation, idioms, least, but, punctuation) are applied as masks on
+        (texts, tokens) matrices.
+        Scores are the same as SentimentIntensityAnalyzer of the installed nltk, including its quirk that
+        a repeated token is scored in the context of its first occurrence.
+        :param cache_capacity: int, max number of cached scores, 0 disables the cache
+        :param nltk_data_path: str, nltk data directory the lexicon is looked up in first
+        :param nltk_download: bool, download the lexicon if it is not found locally
+        """
+        super().__init__(cache_capacity, nltk_data_path, nltk_download)
+        self.analyzer()
+        self.constants = self.sia.constants
+        lexicon = self.sia.lexicon
+        booster_dict = self.constants.BOOSTER_DICT
+        negate = self.constants.NEGATE
+
+        # vocabulary of lower case words, 0 is the unknown word
+        words = sorted(set(lexicon) | set(booster_dict) | set(negate) | {'kind', 'of', 'least', 'at', 'very', 'but'})
+        self.vocabulary = {word: k + 1 for k, word in enumerate(words)}
+        words = [''] + words
+        self.in_lexicon = np.asarray([word in lexicon for word in words])
+        self.valence = np.asarray([lexicon.get(word, 0.0) for word in words], dtype=np.float64)
+        self.is_booster = np.asarray([word in booster_dict for word in words])
+        self.booster = np.asarray([booster_dict.get(word, 0.0) for word in words], dtype=np.float64)
+        self.is_negate = np.asarray([word in negate for word in words])
+        self.is_kind = np.asarray([word == 'kind' for word in words])
+        self.is_of = np.asarray([word == 'of' for word in words])
+        self.is_least = np.asarray([word == 'least' for word in words])
+        self.is_at_very = np.asarray([word in {'at', 'very'} for word in words])
+        self.is_but = np.asarray([word == 'but' for word in words])
+        # nltk 3.5 only knows 'but' and 'BUT', later versions ignore the case
+        self.but_ignores_case = self.sia.polarity_scores('good But bad') == self.sia.polarity_scores('good but bad')
+
+        # codes of case sensitive words in the never, but, idiom and bi-gram booster rules, -1 is any other word
+        self.idioms = [(tuple(idiom.split()), value) for idiom, value in self.constants.SPECIAL_CASE_IDIOMS.items()]
+        self.bigram_boosters = [tuple(booster.split()) for booster in booster_dict if ' ' in booster]
+        exact_words = ['never', 'so', 'this', 'but', 'BUT']
+        for sequence, _ in self.idioms:
+            exact_words.extend(sequence)
+        for sequence in self.bigram_boosters:
+            exact_words.extend(sequence)
+        self.exact = {}
+        for word in exact_words:
+            self.exact.setdefault(word, len(self.exact))
+        self.idioms = [(tuple(self.exact[word] for word in sequence), value) for sequence, value in self.idioms]
+        self.bigram_boosters = [tuple(self.exact[word] for word in sequence) for sequence in self.bigram_boosters]
+
+        self.punctuation = set(string.punctuation)
+        self.punc_list = self.constants.PUNC_LIST
+
+    def strip(self, token):
+        """
+        remove the leading or trailing punctuation of a token, as SentiText does
+        :param token: str, a token of at least 2 characters
+        :return: str, the word, or the token itself if it is not a word with punctuation
+        """
+        if token[0] in self.punctuation:
+            for punc in self.punc_list:
+                if token.startswith(punc):
+                    word = token[len(punc):]
+                    if len(word) > 1 and not any(c in self.punctuation for c in word):
+                        return word
+        elif token[-1] in self.punctuation:
+            for punc in self.punc_list:
+                if token.endswith(punc):
+                    word = token[:-len(punc)]
+                    if len(word) > 1 and not any(c in self.punctuation for c in word):
+                        return word
+        return token
+
+    def encode(self, texts):
+        """
+        tokenize a batch of texts
+        :param texts: list, cleaned texts
+        :return: (tokens, lengths, features) tokens is (texts, max length) token indexes padded with -1,
+        features are arrays of the distinct tokens: vocabulary index, case sensitive word code, all caps, has n't
+        """
+        tokens = {}
+        flat = []
+        lengths = np.zeros(len(texts), dtype=np.int64)
+        for row, text in enumerate(texts):
+            words = [self.strip(token) for token in text.split() if len(token) > 1]
+            flat.extend(tokens.setdefault(word, len(tokens)) for word in words)
+            lengths[row] = len(words)
+
+        matrix = np.full((len(texts), int(lengths.max(initial=0))), -1, dtype=np.int64)
+        matrix[np.arange(matrix.shape[1])[None, :] < lengths[:, None]] = flat
+        lower = [word.lower() for word in tokens]
+        features = (np.asarray([self.vocabulary.get(word, 0) for word in lower] + [0], dtype=np.int64),
+                    np.asarray([self.exact.get(word, -1) for word in tokens] + [-1], dtype=np.int64),
+                    np.asarray([word.isupper() for word in tokens] + [False]),
+                    np.asarray(["n't" in word for word in lower] + [False]))
+        return matrix, lengths, features
+
+    def idioms_check(self, valence, exact):
+        """
+        apply the special case idioms and bi-gram boosters, as SentimentIntensityAnalyzer._idioms_check does
+        :param valence: numpy array, (texts, tokens) valences
+        :param exact: numpy array, (texts, tokens) case sensitive word codes
+        :return: numpy array, (texts, tokens) valences
+        """
+        def matched(offsets, sequence):
+            if len(offsets) != len(sequence):
+                return False
+            return np.logical_and.reduce([shift(exact, k, -1) == code for k, code in zip(offsets, sequence)])
+
+        # the first matched sequence wins
+        idiom = np.full(valence.shape, np.nan)
+        for offsets in ((3, 2), (3, 2, 1), (2, 1), (2, 1, 0), (1, 0)):
+            for sequence, value in self.idioms:
+                idiom = np.where(matched(offsets, sequence), value, idiom)
+        for offsets in ((0, -1), (0, -1, -2)):
+            for sequence, value in self.idioms:
+                idiom = np.where(matched(offsets, sequence), value, idiom)
+        valence = np.where(np.isnan(idiom), valence, idiom)
+
+        bigram = np.zeros(valence.shape, dtype=bool)
+        for sequence in self.bigram_boosters:
+            bigram |= matched((3, 2), sequence) | matched((2, 1), sequence)
+        return np.where(bigram, valence + self.constants.B_DECR, valence)
+
+    def valences(self, matrix, lengths, features):
+        """
+        score every token, as SentimentIntensityAnalyzer.sentiment_valence does
+        :param matrix: numpy array, (texts, max length) token indexes padded with -1
+        :param lengths: numpy array, number of tokens of each text
+        :param features: tuple, features of the distinct tokens made by encode
+        :return: numpy array, (texts, max length) valences, 0 for padding
+        """
+        c = self.constants
+        ids, exact, upper, nt = (feature[matrix] for feature in features)
+        col = np.arange(matrix.shape[1])[None, :]
+        in_lexicon = self.in_lexicon[ids]
+        valence = np.where(in_lexicon, self.valence[ids], 0.0)
+
+        # some but not all words are in all caps
+        caps = upper.sum(axis=1)
+        cap_diff = ((caps > 0) & (caps < lengths))[:, None]
+        valence = np.where(in_lexicon & upper & cap_diff,
+                           np.where(valence > 0, valence + c.C_INCR, valence - c.C_INCR), valence)
+
+        negated = self.is_negate[ids] | nt
+        never = exact == self.exact['never']
+        so_this = (exact == self.exact['so']) | (exact == self.exact['this'])
+        for k in (1, 2, 3):
+            # the k-th preceding word that is not in the lexicon boosts, dampens or negates the word
+            preceding = shift(ids, k, 0)
+            active = in_lexicon & (col >= k) & ~self.in_lexicon[preceding]
+            scalar = np.where(valence < 0, -self.booster[preceding], self.booster[preceding])
+            scalar = np.where(self.is_booster[preceding] & shift(upper, k, False) & cap_diff,
+                              np.where(valence > 0, scalar + c.C_INCR, scalar - c.C_INCR), scalar)
+            if k == 2:
+                scalar = scalar * 0.95
+            elif k == 3:
+                scalar = scalar * 0.9
+            valence = np.where(active, valence + scalar, valence)
+
+            if k == 1:
+                emphasis, factor = np.zeros(valence.shape, dtype=bool), 1.5
+            elif k == 2:
+                emphasis, factor = shift(never, 2, False) & shift(so_this, 1, False), 1.5
+            else:
+                emphasis, factor = (shift(never, 3, False) & shift(so_this, 2, False)) | shift(so_this, 1, False), 1.25
+            valence = np.where(active & emphasis, valence * factor, valence)
+            valence = np.where(active & ~emphasis & shift(negated, k, False), valence * c.N_SCALAR, valence)
+            if k == 3:
+                valence = np.where(active, self.idioms_check(valence, exact), valence)
+
+        least = shift(self.is_least[ids] & ~in_lexicon, 1, False) & ~shift(self.is_at_very[ids], 2, False)
+        valence = np.where(in_lexicon & least, valence * c.N_SCALAR, valence)
+
+        # boosters and 'kind of' are not scored themselves
+        skipped = self.is_booster[ids] | (self.is_kind[ids] & shift(self.is_of[ids], -1, False))
+        return np.where(skipped | (matrix < 0), 0.0, valence)
+
+    def polarity_scores_batch(self, texts):
+        """
+        score a batch of texts, as SentimentIntensityAnalyzer.polarity_scores does
+        :param texts: list, cleaned texts
+        :return: list, dict of neg, neu, pos, compound of each text
+        """
+        matrix, lengths, features = self.encode(texts)
+        valence = self.valences(matrix, lengths, features)
+        rows, cols = matrix.shape
+        col = np.arange(cols)[None, :]
+
+        # a repeated token is scored in the context of its first occurrence
+        keys = (np.arange(rows)[:, None] * (len(features[0]) + 1) + matrix)[matrix >= 0]
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        flat = valence[matrix >= 0]
+        valence[matrix >= 0] = flat[first[inverse.reshape(-1)]]
+
+        # words before the first 'but' are halved, words after it are boosted
+        if self.but_ignores_case:
+            but = self.is_but[features[0][matrix]]
+        else:
+            exact = features[1][matrix]
+            but = (exact == self.exact['but']) | (exact == self.exact['BUT'])
+        but_idx = np.where(but.any(axis=1), but.argmax(axis=1), cols)[:, None]
+        has_but = but_idx < cols
+        valence = np.where(has_but & (col < but_idx), valence * 0.5, valence)
+        valence = np.where(has_but & (col > but_idx), valence * 1.5, valence)
+
+        # sum column by column, in the same order as sum() over a list
+        sum_s = np.zeros(rows)
+        pos_sum = np.zeros(rows)
+        neg_sum = np.zeros(rows)
+        for j in range(cols):
+            v = valence[:, j]
+            sum_s = sum_s + v
+            pos_sum = pos_sum + np.where(v > 0, v + 1, 0.0)
+            neg_sum = neg_sum + np.where(v < 0, v - 1, 0.0)
+        neu_count = ((valence == 0) & (col < lengths[:, None])).sum(axis=1)
+
+        res = []
+        for k, text in enumerate(texts):
+            if not lengths[k]:
+                res.append({'neg': 0.0, 'neu': 0.0, 'pos': 0.0, 'compound': 0.0})
+                continue
+            ep_count = min(text.count('!'), 4)
+            qm_count = text.count('?')
+            amplifier = ep_count * 0.292 + ((qm_count * 0.18 if qm_count <= 3 else 0.96) if qm_count > 1 else 0)
+            s, pos, neg = float(sum_s[k]), float(pos_sum[k]), float(neg_sum[k])
+            if s > 0:
+                s += amplifier
+            elif s < 0:
+                s -= amplifier
+            compound = s / math.sqrt(s * s + 15)
+            if pos > math.fabs(neg):
+                pos += amplifier
+            elif pos < math.fabs(neg):
+                neg -= amplifier
+            total = pos + math.fabs(neg) + int(neu_count[k])
+            res.append({'neg': round(math.fabs(neg / total), 3),
+                        'neu': round(math.fabs(int(neu_count[k]) / total), 3),
+                        'pos': round(math.fabs(pos / total), 3),
+                        'compound': round(compound, 4)})
+        return res
+
+    def score_batch(self, texts):
+        """
+        run sentiment segmentation on a batch of texts, duplicated and cached texts are scored once
+        :param texts: list, text strings
+        :return: list, sentiment scores of each text
+        """
+        res = [None] * len(texts)
+        # indexes of each text to score
+        missed = {}
+        for i, text in enumerate(texts):
+            text = self.clean(text)
+            if self.cache is not None:
+                sent_scores = self.cache.get(self.digest(text))
+                if sent_scores is not None:
+                    res[i] = dict(sent_scores)
+                    continue
+            missed.setdefault(text, []).append(i)
+
+        missed_texts = list(missed)
+        for start in range(0, len(missed_texts), self.chunk_size):
+            chunk = missed_texts[start:start + self.chunk_size]
+            for text, sent_scores in zip(chunk, self.polarity_scores_batch(chunk)):
+                sent_scores = self.label(sent_scores)
+                if self.cache is not None:
+                    self.cache.put(self.digest(text), dict(sent_scores))
+                for i in missed[text]:
+                    res[i] = dict(sent_scores)
+        return res
+
+
+if __name__ == '__main__':
+    # testing code, compare with SentimentIntensityAnalyzer, run in mapreduce/tools by python -m utils.bulk_sentiment
+    import random
+    import time
+
+    engine = BulkSentimentEngine()
+    c = engine.constants
+    words = [word for word in engine.sia.lexicon if ' ' not in word] + list(c.BOOSTER_DICT) + list(c.NEGATE) * 5 \
+        + ['kind', 'of', 'least', 'at', 'very', 'never', 'so', 'this', 'but', 'the', 'shit', 'bomb', 'bad', 'ass',
+           'yeah', 'right', 'kiss', 'death', 'sort', 'just', 'enough', 'a', 'dog', 'is', '#happy', '@bob'] * 20
+    random.seed(42)
+    texts = ["I LOVE this!!! @bob https://t.co/Vz0ID9xG5D", "not good at all :(", "The weather is kinda bad but ok",
+             "never so happy", "this is the shit", "at least good", "kind of good", "yeah right, great", "",
+             "GOOD GOOD good", "I am not very happy??"]
+    for _ in range(20000):
+        text = []
+        for _ in range(random.randint(0, 25)):
+            word = random.choice(words)
+            r = random.random()
+            word = word.upper() if r < 0.15 else word.capitalize() if r < 0.2 else word
+            r = random.random()
+            word = word + random.choice(['.', '!', '?', ',', '!!']) if r < 0.1 else '"' + word if r < 0.15 else word
+            text.append(word)
+        texts.append(' '.join(text))
+
+    start = time.time()
+    expected = [engine.label(engine.sia.polarity_scores(engine.clean(text))) for text in texts]
+    print("SentimentIntensityAnalyzer: {:.2f}s".format(time.time() - start))
+    start = time.time()
+    scores = engine.score_batch(texts)
+    print("BulkSentimentEngine: {:.2f}s".format(time.time() - start))
+    # nltk 3.5 picks either of 'but' and 'BUT' by set order if a text has both, so a few may mismatch
+    mismatched = [(text, a, b) for text, a, b in zip(texts, expected, scores) if a != b]
+    print("{} of {} mismatched".format(len(mismatched), len(texts)))
+    for text, a, b in mismatched[:10]:
+        print(text, a, b)
@@ -4,9 +4,9 @@
 import logging
 import os
 from time import sleep
-from cloudant.client import Cloudant
 from requests.exceptions import HTTPError
 from utils.config import Config
+from utils.couch_session import PooledCloudant
 from utils.logger import get_logger
 
 logger = get_logger('Database', logging.DEBUG)
@@ -31,8 +31,10 @@ class CouchDB:
         while count:
             logger.debug("[*] Connecting to CouchDB -> {}".format(self.config.couch.url))
             try:
-                self.client = Cloudant(self.config.couch.username, self.config.couch.password,
-                                       url=self.config.couch.url, connect=True)
+                self.client = PooledCloudant(self.config.couch.username, self.config.couch.password,
+                                             self.config.couch.url, self.config.couch.pool_size,
+                                             self.config.couch.timeout, self.config.couch.doc_cache_capacity,
+                                             self.config.couch.doc_cache_ttl, connect=True)
                 self.client.connect()
                 logger.debug("[*] CouchDB connected -> {}".format(self.config.couch.url))
                 return
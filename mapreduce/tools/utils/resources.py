@@ -0,0 +1,53 @@
+"""
+@author Team 42, Chengdu, China, Qifan Deng, 1077479
+"""
+import os
+
+# nltk resource name -> path of the resource in a nltk data directory
+NLTK_RESOURCES = {
+    'vader_lexicon': 'sentiment/vader_lexicon.zip',
+}
+
+
+def use_nltk_data(path):
+    """
+    look up nltk data in a local directory before the default ones
+    :param path: str, nltk data directory, e.g. the one bundled in the image
+    """
+    import nltk
+    path = os.path.abspath(path)
+    if path not in nltk.data.path:
+        nltk.data.path.insert(0, path)
+
+
+def find_nltk_resource(name, path=None, download=False):
+    """
+    find a nltk resource in the local nltk data directories, the network is only used if the resource
+    is missing and downloading is allowed
+    :param name: str, resource name, a key of NLTK_RESOURCES
+    :param path: str, nltk data directory looked up first and downloaded to, None for the default ones
+    :param download: bool, download the resource if it is missing
+    :return: str, path of the resource
+    """
+    import nltk
+    if path:
+        use_nltk_data(path)
+    try:
+        return nltk.data.find(NLTK_RESOURCES[name])
+    except LookupError:
+        if not download:
+            raise
+    nltk.download(name, download_dir=os.path.abspath(path) if path else None, quiet=True, raise_on_error=True)
+    return nltk.data.find(NLTK_RESOURCES[name])
+
+
+def fetch_nltk_resources(path, logger=None):
+    """
+    download the missing nltk resources to a local directory, so they are bundled rather than downloaded at startup
+    :param path: str, nltk data directory
+    :param logger: logger to report the resources
+    """
+    for name in NLTK_RESOURCES:
+        resource = find_nltk_resource(name, path, download=True)
+        if logger is not None:
+            logger.info("[*] NLTK resource {} -> {}".format(name, resource))
@@ -0,0 +1,95 @@
+"""
+@author Team 42, Chengdu, China, Qifan Deng, 1077479
+"""
+import re
+import hashlib
+from utils.cache import LRUCache
+from utils.resources import find_nltk_resource
+
+# remove mentions, urls and other non english characters
+CLEAN_PATTERN = re.compile(r"(@[A-Za-z0-9]+)|([^0-9A-Za-z \t]) |(\w+:\/\/\S+)")
+
+
+class SentimentEngine:
+    def __init__(self, cache_capacity=0, nltk_data_path=None, nltk_download=False):
+        """
+        A VADER sentiment scorer, the lexicon is loaded once rather than for every text
+        :param cache_capacity: int, max number of cached scores keyed by the hash of cleaned texts,
+        so retweets and duplicated texts are scored once, 0 disables the cache
+        :param nltk_data_path: str, nltk data directory the lexicon is looked up in first
+        :param nltk_download: bool, download the lexicon if it is not found locally
+        """
+        # nltk is imported and the lexicon is loaded on the first use
+        self.sia = None
+        self.nltk_data_path = nltk_data_path
+        self.nltk_download = nltk_download
+        self.cache = LRUCache(cache_capacity) if cache_capacity > 0 else None
+
+    @staticmethod
+    def clean(text):
+        """
+        clean a tweet content before run sentiment segmentation on it
+        :param text: tweet content
+        :return: cleaned tweet content
+        """
+        return ' '.join(CLEAN_PATTERN.sub(" ", text).split())
+
+    @staticmethod
+    def digest(text):
+        """
+        :param text: cleaned tweet content
+        :return: bytes, the cache key of a text
+        """
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    @staticmethod
+    def label(sent_scores):
+        """
+        label sentiment scores by the compound score
+        :param sent_scores: dict, sentiment scores
+        :return: dict, sentiment scores with the sentiment label
+        """
+        if sent_scores['compound'] > 0:
+            sent_scores['sentiment'] = "positive"
+        elif sent_scores['compound'] < 0:
+            sent_scores['sentiment'] = "negative"
+        else:
+            sent_scores['sentiment'] = "neutral"
+        return sent_scores
+
+    def analyzer(self):
+        """
+        :return: SentimentIntensityAnalyzer, created on the first call
+        """
+        if self.sia is None:
+            find_nltk_resource('vader_lexicon', self.nltk_data_path, self.nltk_download)
+            from nltk.sentiment.vader import SentimentIntensityAnalyzer
+            self.sia = SentimentIntensityAnalyzer()
+        return self.sia
+
+    def score(self, text):
+        """
+        run sentiment segmentation on a text
+        :param text: a text string
+        :return: dict, sentiment scores neg, neu, pos, compound and the sentiment label
+        """
+        text = self.clean(text)
+        key = None
+        if self.cache is not None:
+            key = self.digest(text)
+            sent_scores = self.cache.get(key)
+            if sent_scores is not None:
+                return dict(sent_scores)
+
+        sent_scores = self.label(self.analyzer().polarity_scores(text))
+        if key is not None:
+            self.cache.put(key, dict(sent_scores))
+        return sent_scores
+
+    def score_batch(self, texts):
+        """
+        run sentiment segmentation on a batch of texts
+        :param texts: list, text strings
+        :return: list, sentiment scores of each text
+        """
+        return [self.score(text) for text in texts]
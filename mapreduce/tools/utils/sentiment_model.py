@@ -1,32 +1,23 @@
 """
 @author Team 42, Melbourne, Mandeep Singh, 991857
 """
-import nltk
-import re
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
+from utils.config import Config
+from utils.bulk_sentiment import BulkSentimentEngine
+from utils.sentiment import SentimentEngine
 
-try:
-    nltk.download('vader_lexicon')
-except:
-    pass
+config = Config()
+# the lexicon is only downloaded if it is not in the local nltk data
+engine = SentimentEngine(config.sentiment_cache_capacity, config.nltk_data_path, config.nltk_download)
+# for backfilling and re-scoring
+bulk_engine = BulkSentimentEngine(config.sentiment_cache_capacity, config.nltk_data_path, config.nltk_download)
 
 
 def clean_tweet(tweet):
-    # remove urls and other non english characters
-    return ' '.join(re.sub("(@[A-Za-z0-9]+)|([^0-9A-Za-z \t]) |(\w+:\/\/\S+)", " ", tweet).split())
+    return engine.clean(tweet)
 
 
 def generate_sentiment(text):
-    tweet_text = clean_tweet(text)
-    sia = SentimentIntensityAnalyzer()
-    sent_scores = sia.polarity_scores(tweet_text)
-    if sent_scores['compound'] > 0:
-        sent_scores['sentiment'] = "positive"
-    elif sent_scores['compound'] < 0:
-        sent_scores['sentiment'] = "negative"
-    else:
-        sent_scores['sentiment'] = "neutral"
-    return sent_scores
+    return engine.score(text)
 
 
 if __name__ == '__main__':
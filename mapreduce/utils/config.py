@@ -9,19 +9,28 @@ logger = get_logger('Config', logging.DEBUG)
 
 
 class CouchConfig:
-    def __init__(self, protocol, host, port, username, password):
+    def __init__(self, protocol, host, port, username, password, pool_size=10, timeout=60, doc_cache_capacity=1000,
+                 doc_cache_ttl=5):
         """
         :param protocol: CouchDB protocol, e.g. 'http'
         :param host: CouchDB host addr, e.g. '127.0.0.1'
         :param port: CouchDB port number, e.g. 5984
         :param username: CouchDB username
         :param password: password of user
+        :param pool_size: max number of connections
+        :param timeout: max seconds of a request
+        :param doc_cache_capacity: max number of cached docs of each database
+        :param doc_cache_ttl: seconds a cached doc is used before it is fetched again
         """
         self.protocol = protocol
         self.host = host
         self.port = port
         self.username = username
         self.password = password
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.doc_cache_capacity = doc_cache_capacity
+        self.doc_cache_ttl = doc_cache_ttl
         self.url = "{}://{}:{}".format(self.protocol, self.host, self.port)
 
 
@@ -29,8 +38,10 @@ class Config:
     def __init__(self):
         with open("couchdb.json") as t:
             t_json = json.loads(t.read())
+            # the pool settings are optional
             self.couch = CouchConfig(t_json["protocol"], t_json["host"], t_json["port"], t_json["username"],
-                                     t_json["password"])
+                                     t_json["password"], t_json.get("pool_size", 10), t_json.get("timeout", 60),
+                                     t_json.get("doc_cache_capacity", 1000), t_json.get("doc_cache_ttl", 5))
             logger.debug(
                 "[*] Loaded CouchDB config -> {}://{}:{}".format(self.couch.protocol, self.couch.host, self.couch.port))
 